@@ -0,0 +1,295 @@
+# alerts.py
+# Streaming alert rules evaluated incrementally on every telemetry sample.
+#
+# Each rule keeps O(1) state per sample (no history re-scans) and reports a
+# boolean "active" condition. The engine turns condition changes into
+# de-duplicated `raised` / `cleared` events, applying per-rule hysteresis and a
+# cooldown so a value hovering around a limit does not flap.
+
+import json
+import math
+import threading
+import time
+from collections import deque
+
+
+class Rule:
+    """Base rule: subclasses implement `update(value, ts, active) -> bool`."""
+
+    kind = 'rule'
+    # Rules whose statistics assume evenly spaced samples set this; the engine
+    # then feeds them only full samples (see AlertEngine.evaluate).
+    full_only = False
+
+    def __init__(self, name, field, severity='warning', cooldown=30.0, message=None):
+        self.name = name
+        self.field = field
+        self.severity = severity
+        self.cooldown = float(cooldown)
+        self.message = message
+
+    def update(self, value, ts, active):
+        raise NotImplementedError
+
+    def describe(self):
+        return {'name': self.name, 'type': self.kind, 'field': self.field, 'severity': self.severity}
+
+
+class ThresholdRule(Rule):
+    """Static limit. Active above `above` (or below `below`); clears once back past the limit by `hysteresis`."""
+
+    kind = 'threshold'
+
+    def __init__(self, name, field, above=None, below=None, hysteresis=0.0, **kw):
+        super().__init__(name, field, **kw)
+        if above is None and below is None:
+            raise ValueError(f'threshold rule {name!r} needs `above` or `below`')
+        self.above = above
+        self.below = below
+        self.hysteresis = float(hysteresis)
+
+    def update(self, value, ts, active):
+        if self.above is not None:
+            if value > self.above or (active and value > self.above - self.hysteresis):
+                return True
+        if self.below is not None:
+            if value < self.below or (active and value < self.below + self.hysteresis):
+                return True
+        return False
+
+    def describe(self):
+        d = super().describe()
+        d.update(above=self.above, below=self.below, hysteresis=self.hysteresis)
+        return d
+
+
+class ZScoreRule(Rule):
+    """Rolling-window z-score using running sum / sum of squares (O(1) add and evict)."""
+
+    kind = 'zscore'
+    # Deadband-filtered partial updates only carry values that moved, which
+    # would fill the window with outliers and skew mean/std.
+    full_only = True
+
+    def __init__(self, name, field, window=120, z=4.0, z_clear=None, min_samples=20, **kw):
+        super().__init__(name, field, **kw)
+        self.window = int(window)
+        self.z = float(z)
+        self.z_clear = float(z_clear) if z_clear is not None else self.z * 0.75
+        self.min_samples = int(min_samples)
+        self._values = deque()
+        self._sum = 0.0
+        self._sumsq = 0.0
+
+    def update(self, value, ts, active):
+        n = len(self._values)
+        score = 0.0
+        if n >= self.min_samples:
+            mean = self._sum / n
+            var = max(self._sumsq / n - mean * mean, 0.0)
+            std = math.sqrt(var)
+            if std > 1e-9:
+                score = abs(value - mean) / std
+        # Add the sample after scoring so an outlier doesn't dilute its own score
+        self._values.append(value)
+        self._sum += value
+        self._sumsq += value * value
+        if len(self._values) > self.window:
+            old = self._values.popleft()
+            self._sum -= old
+            self._sumsq -= old * old
+        return score >= (self.z_clear if active else self.z)
+
+    def describe(self):
+        d = super().describe()
+        d.update(window=self.window, z=self.z, z_clear=self.z_clear)
+        return d
+
+
+class RateOfChangeRule(Rule):
+    """Active when |d(value)/dt| exceeds `max_rate` units per second.
+
+    `ts` is ingest time, so messages arriving back to back (broker backlog
+    flushes, fast replays, partial updates) would give huge rates over a few
+    milliseconds. The rate is therefore taken against an anchor sample at
+    least `min_dt` seconds older; samples in between leave the state as is.
+    """
+
+    kind = 'rate'
+
+    def __init__(self, name, field, max_rate, clear_rate=None, min_dt=1.0, **kw):
+        super().__init__(name, field, **kw)
+        self.max_rate = float(max_rate)
+        self.clear_rate = float(clear_rate) if clear_rate is not None else self.max_rate * 0.5
+        self.min_dt = float(min_dt)
+        self._anchor = None
+
+    def update(self, value, ts, active):
+        anchor = self._anchor
+        if anchor is None or ts < anchor[1]:
+            self._anchor = (value, ts)
+            return active
+        dt = ts - anchor[1]
+        if dt < self.min_dt:
+            return active
+        self._anchor = (value, ts)
+        rate = abs(value - anchor[0]) / dt
+        return rate > (self.clear_rate if active else self.max_rate)
+
+    def describe(self):
+        d = super().describe()
+        d.update(max_rate=self.max_rate, clear_rate=self.clear_rate, min_dt=self.min_dt)
+        return d
+
+
+RULE_TYPES = {cls.kind: cls for cls in (ThresholdRule, ZScoreRule, RateOfChangeRule)}
+
+DEFAULT_RULES = [
+    {'type': 'threshold', 'name': 'obstacle_proximity', 'field': 'forward_distance_cm', 'below': 25, 'hysteresis': 5, 'severity': 'critical', 'cooldown': 5},
+    {'type': 'threshold', 'name': 'air_quality_high', 'field': 'air_quality_raw', 'above': 20000, 'hysteresis': 1000},
+    {'type': 'threshold', 'name': 'temperature_excursion', 'field': 'temperature_c', 'above': 45, 'below': 0, 'hysteresis': 1},
+    {'type': 'zscore', 'name': 'temperature_anomaly', 'field': 'temperature_c', 'window': 120, 'z': 4},
+    {'type': 'rate', 'name': 'temperature_spike', 'field': 'temperature_c', 'max_rate': 2.0},
+]
+
+
+def build_rules(specs):
+    rules = []
+    for spec in specs:
+        spec = dict(spec)
+        kind = spec.pop('type')
+        if kind not in RULE_TYPES:
+            raise ValueError(f'unknown alert rule type {kind!r}')
+        rules.append(RULE_TYPES[kind](**spec))
+    return rules
+
+
+def load_rules(path=None):
+    """Load rule specs from a JSON file (list of objects), falling back to DEFAULT_RULES."""
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            return build_rules(json.load(f))
+    return build_rules(DEFAULT_RULES)
+
+
+class AlertEngine:
+    def __init__(self, rules, history=200):
+        self.rules = list(rules)
+        self._by_field = {}
+        for rule in self.rules:
+            self._by_field.setdefault(rule.field, []).append(rule)
+        self.active = {}          # rule name -> raised event
+        self._last_raised = {}    # rule name -> ts of last raised event (cooldown)
+        self.events = deque(maxlen=history)
+        self._seq = 0
+        self._listeners = []
+        self._cond = threading.Condition()
+        # Per-sample evaluation cost
+        self.samples = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def add_listener(self, fn):
+        """Register fn(event) called for every raised/cleared event (e.g. MQTT publish)."""
+        self._listeners.append(fn)
+
+    def evaluate(self, sample, ts=None, full=True):
+        """Evaluate all rules against one telemetry dict; returns the list of new events.
+
+        Pass full=False for a partial (deadband-filtered) update: rules with
+        `full_only` set skip it and only see full samples (heartbeats).
+        """
+        t0 = time.perf_counter_ns()
+        ts = time.time() if ts is None else ts
+        emitted = []
+        for field, rules in self._by_field.items():
+            value = sample.get(field)
+            if value is None or isinstance(value, bool):
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            for rule in rules:
+                if rule.full_only and not full:
+                    continue
+                was_active = rule.name in self.active
+                now_active = rule.update(value, ts, was_active)
+                if now_active == was_active:
+                    continue
+                if now_active:
+                    # De-duplicate: suppress re-raising inside the cooldown window
+                    if ts - self._last_raised.get(rule.name, -math.inf) < rule.cooldown:
+                        continue
+                    self._last_raised[rule.name] = ts
+                emitted.append(self._transition(rule, value, ts, now_active))
+        elapsed = time.perf_counter_ns() - t0
+        self.samples += 1
+        self.total_ns += elapsed
+        if elapsed > self.max_ns:
+            self.max_ns = elapsed
+        if emitted:
+            for event in emitted:
+                for fn in self._listeners:
+                    try:
+                        fn(event)
+                    except Exception as e:
+                        print('Alert listener failed:', e)
+            with self._cond:
+                self._cond.notify_all()
+        return emitted
+
+    def _transition(self, rule, value, ts, raised):
+        with self._cond:
+            self._seq += 1
+            event = {
+                'id': self._seq,
+                'rule': rule.name,
+                'type': rule.kind,
+                'field': rule.field,
+                'severity': rule.severity,
+                'state': 'raised' if raised else 'cleared',
+                'value': value,
+                'ts': ts,
+                'message': rule.message or f'{rule.name} {"raised" if raised else "cleared"} ({rule.field}={value:g})',
+            }
+            self.events.append(event)
+            if raised:
+                self.active[rule.name] = event
+            else:
+                self.active.pop(rule.name, None)
+        return event
+
+    def active_alerts(self):
+        with self._cond:
+            return list(self.active.values())
+
+    def last_seq(self):
+        with self._cond:
+            return self._seq
+
+    def events_since(self, last_id=0):
+        with self._cond:
+            if last_id > self._seq:
+                last_id = 0     # id from before a server restart
+            return [e for e in self.events if e['id'] > last_id]
+
+    def wait_for_events(self, last_id, timeout):
+        """Block until an event newer than last_id exists (or timeout); returns the new events.
+
+        An id ahead of this engine's sequence comes from a previous server
+        process (EventSource reconnecting with its Last-Event-ID) and counts as 0.
+        """
+        with self._cond:
+            if last_id > self._seq:
+                last_id = 0
+            self._cond.wait_for(lambda: self._seq > last_id, timeout=timeout)
+            return [e for e in self.events if e['id'] > last_id]
+
+    def stats(self):
+        return {
+            'samples': self.samples,
+            'mean_us': (self.total_ns / self.samples / 1000.0) if self.samples else 0.0,
+            'max_us': self.max_ns / 1000.0,
+            'rules': len(self.rules),
+        }
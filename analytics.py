@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# analytics.py
+# Parallel chunked statistics scan over telemetry logs (data/odyssey_log.csv and
+# archived segments of it).
+#
+# Each log file is split into line-aligned byte ranges. A process pool reduces
+# every chunk to mergeable partial aggregates per hour bucket (count, sum, sum of
+# squares, min, max per metric, plus seconds with air quality above a
+# threshold) using NumPy. The partials are merged into hourly and daily
+# summaries. Workers only return a few arrays per chunk, so throughput scales
+# with the number of cores until the disk becomes the bottleneck.
+#
+# The summary is the format of the server's rollup store (ROLLUP_FILE): write it
+# with --out to seed the store, or run the same scan from the server via
+# POST /api/analytics/scan.
+#
+# Usage:
+#   python analytics.py data/odyssey_log.csv archive/*.csv --workers 8 --out data/rollups.json
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+# Log columns (see LOG_COLUMNS in app.py); metrics are summarised by name
+LOG_COLUMNS = ['timestamp', 'power', 'mode', 'forward_distance', 'temperature', 'humidity', 'air_quality', 'rover']
+METRICS = ['forward_distance', 'temperature', 'humidity', 'air_quality']
+AQ_INDEX = METRICS.index('air_quality')
+LOG_TIME_FORMAT = '%Y-%m-%d %H:%M:%S UTC'
+CHUNK_BYTES = 4 * 1024 * 1024
+# Below this size a file is not worth splitting further for more workers
+MIN_CHUNK_BYTES = 256 * 1024
+# Air quality raw value treated as "poor" (matches the default air_quality_high alert)
+AQ_THRESHOLD = 20000
+# A sample counts for the time until the next one, but never longer than this
+# (gaps are logging pauses, not sustained readings)
+MAX_SAMPLE_GAP_S = 60
+
+
+def plan_chunks(path, chunk_bytes=CHUNK_BYTES, min_chunks=1):
+    """Split a file into [start, end) byte ranges that begin and end on line boundaries."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    target = max(1, -(-size // max(chunk_bytes, 1)))
+    # give every worker a share once the file is big enough to be worth splitting
+    target = max(target, min(min_chunks, size // MIN_CHUNK_BYTES))
+    step = size / target
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, target):
+            f.seek(int(i * step))
+            f.readline()  # move to the start of the next full line
+            pos = f.tell()
+            if bounds[-1] < pos < size:
+                bounds.append(pos)
+    bounds.append(size)
+    return [(path, start, end) for start, end in zip(bounds, bounds[1:])]
+
+
+def _empty_partial():
+    n = len(METRICS)
+    return {
+        'buckets': np.zeros(0, dtype=np.int64),
+        'count': np.zeros((0, n), dtype=np.int64),
+        'sum': np.zeros((0, n)),
+        'sumsq': np.zeros((0, n)),
+        'min': np.zeros((0, n)),
+        'max': np.zeros((0, n)),
+        'above_s': np.zeros(0),
+        'rows': 0,
+        'first_ts': None,
+        'last': None,
+    }
+
+
+def _reduce_runs(keys, count, total, sumsq, low, high, above):
+    """Aggregate rows that share a key; keys must be sorted."""
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return {
+        'buckets': keys[starts],
+        'count': np.add.reduceat(count, starts, axis=0),
+        'sum': np.add.reduceat(total, starts, axis=0),
+        'sumsq': np.add.reduceat(sumsq, starts, axis=0),
+        # fmin/fmax skip NaN, so metrics missing from a row do not poison the bucket
+        'min': np.fmin.reduceat(low, starts, axis=0),
+        'max': np.fmax.reduceat(high, starts, axis=0),
+        'above_s': np.add.reduceat(above, starts),
+    }
+
+
+def read_chunk(path, start, end):
+    """Parse one byte range of a log into (epoch seconds, values[n, metric]) sorted by time."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    # Older rows have 7 fields and newer ones the trailing rover column; naming
+    # all 8 columns pads the short rows instead of rejecting them.
+    # (usecols cannot be combined with that padding, so all columns are read.)
+    frame = pd.read_csv(
+        io.BytesIO(data), header=None, names=LOG_COLUMNS,
+        dtype={'timestamp': str, 'power': str, 'mode': str, 'rover': str}, on_bad_lines='skip', engine='c',
+    )
+    stamps = pd.to_datetime(frame['timestamp'], format=LOG_TIME_FORMAT, errors='coerce', utc=True)
+    keep = stamps.notna().to_numpy()  # drops the header row and malformed lines
+    ts = stamps[keep].to_numpy(dtype='datetime64[s]').astype(np.int64)
+    values = np.column_stack([
+        pd.to_numeric(frame[m][keep], errors='coerce').to_numpy(dtype=np.float64) for m in METRICS
+    ]) if len(ts) else np.zeros((0, len(METRICS)))
+    order = np.argsort(ts, kind='stable')  # the log is time ordered, so this is ~free
+    return ts[order], values[order]
+
+
+def scan_chunk(task):
+    """Worker: partial aggregates for one (path, start, end, aq_threshold, max_gap) chunk."""
+    path, start, end, aq_threshold, max_gap = task
+    ts, values = read_chunk(path, start, end)
+    if not len(ts):
+        return _empty_partial()
+    duration = np.zeros(len(ts))
+    duration[:-1] = np.minimum(np.diff(ts), max_gap)
+    above = values[:, AQ_INDEX] > aq_threshold  # NaN compares False
+    valid = ~np.isnan(values)
+    partial = _reduce_runs(
+        ts // 3600,
+        valid.astype(np.int64),
+        np.where(valid, values, 0.0),
+        np.where(valid, values * values, 0.0),
+        values,
+        values,
+        np.where(above, duration, 0.0),
+    )
+    # The last row's duration depends on the next chunk's first timestamp;
+    # the reducer fills it in (see merge_partials).
+    partial['rows'] = len(ts)
+    partial['first_ts'] = int(ts[0])
+    partial['last'] = (int(ts[-1]), bool(above[-1]))
+    return partial
+
+
+def merge_partials(partials, max_gap=MAX_SAMPLE_GAP_S, bucket_s=3600):
+    """Merge chunk partials (in file order) into one aggregate keyed by `bucket_s` buckets."""
+    parts = [p for p in partials if len(p['buckets'])]
+    if not parts:
+        return _empty_partial()
+    extra_keys, extra_above = [], []
+    for prev, nxt in zip(parts, parts[1:]):
+        # Stitch chunk boundaries: credit the previous chunk's last sample
+        if prev.get('last') and prev['last'][1] and nxt.get('first_ts') is not None:
+            gap = nxt['first_ts'] - prev['last'][0]
+            if gap >= 0:
+                extra_keys.append(prev['last'][0] // 3600)
+                extra_above.append(min(gap, max_gap))
+    n = len(METRICS)
+    k = len(extra_keys)
+    hours = np.concatenate([p['buckets'] for p in parts] + [np.asarray(extra_keys, dtype=np.int64)])
+    keys = hours * 3600 // bucket_s
+    stack = lambda name, fill: np.concatenate([p[name] for p in parts] + [np.full((k, n), fill)])
+    order = np.argsort(keys, kind='stable')
+    merged = _reduce_runs(
+        keys[order],
+        stack('count', 0).astype(np.int64)[order],
+        stack('sum', 0.0)[order],
+        stack('sumsq', 0.0)[order],
+        stack('min', np.nan)[order],
+        stack('max', np.nan)[order],
+        np.concatenate([p['above_s'] for p in parts] + [np.asarray(extra_above, dtype=np.float64)])[order],
+    )
+    merged['rows'] = sum(p['rows'] for p in parts)
+    return merged
+
+
+def _summary_rows(aggregate, bucket_s):
+    rows = []
+    for i, bucket in enumerate(aggregate['buckets']):
+        start = int(bucket) * bucket_s
+        metrics = {}
+        for j, name in enumerate(METRICS):
+            count = int(aggregate['count'][i, j])
+            if not count:
+                continue
+            mean = aggregate['sum'][i, j] / count
+            var = max(aggregate['sumsq'][i, j] / count - mean * mean, 0.0)
+            metrics[name] = {
+                'count': count,
+                'min': float(aggregate['min'][i, j]),
+                'max': float(aggregate['max'][i, j]),
+                'mean': round(float(mean), 4),
+                'std': round(float(np.sqrt(var)), 4),
+            }
+        rows.append({
+            'start': datetime.fromtimestamp(start, timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC'),
+            'ts': start,
+            'samples': int(aggregate['count'][i].max()),
+            'metrics': metrics,
+            'air_quality_above_min': round(float(aggregate['above_s'][i]) / 60.0, 3),
+        })
+    return rows
+
+
+def run_scan(paths, workers=None, chunk_bytes=CHUNK_BYTES, aq_threshold=AQ_THRESHOLD, max_gap=MAX_SAMPLE_GAP_S):
+    """Scan log files in parallel and return the rollup summary (hourly + daily)."""
+    started = time.perf_counter()
+    workers = max(1, workers or os.cpu_count() or 1)
+    paths = [str(p) for p in paths if os.path.exists(p)]
+    chunks = [c for p in paths for c in plan_chunks(p, chunk_bytes, min_chunks=workers)]
+    tasks = [(path, start, end, aq_threshold, max_gap) for path, start, end in chunks]
+    if workers == 1 or len(tasks) <= 1:
+        partials = [scan_chunk(t) for t in tasks]
+    else:
+        # spawn: the server process has MQTT/Flask threads that must not be forked
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=multiprocessing.get_context('spawn')) as pool:
+            partials = list(pool.map(scan_chunk, tasks))
+    # Stitch boundaries only between chunks of the same file
+    by_file = {}
+    for (path, _, _), partial in zip(chunks, partials):
+        by_file.setdefault(path, []).append(partial)
+    hourly = merge_partials([merge_partials(parts, max_gap) for parts in by_file.values()], max_gap)
+    daily = merge_partials([hourly], max_gap, bucket_s=86400)
+    elapsed = time.perf_counter() - started
+    scanned = sum(end - start for _, start, end in chunks)
+    return {
+        'generated': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC'),
+        'sources': paths,
+        'aq_threshold': aq_threshold,
+        'hourly': _summary_rows(hourly, 3600),
+        'daily': _summary_rows(daily, 86400),
+        'stats': {
+            'rows': hourly['rows'],
+            'bytes': scanned,
+            'chunks': len(chunks),
+            'workers': workers,
+            'seconds': round(elapsed, 3),
+            'mb_per_s': round(scanned / elapsed / 1e6, 2) if elapsed > 0 else None,
+        },
+    }
+
+
+def save_rollups(summary, path):
+    """Write a summary atomically so the server never reads a half-written store."""
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(summary, f)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parallel daily/hourly statistics over telemetry logs')
+    parser.add_argument('paths', nargs='*', default=['data/odyssey_log.csv'], help='log files / archived segments')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes (default: all cores)')
+    parser.add_argument('--chunk-mb', type=float, default=CHUNK_BYTES / 1024 / 1024, help='target chunk size in MiB')
+    parser.add_argument('--aq-threshold', type=float, default=AQ_THRESHOLD, help='air quality level counted as "above"')
+    parser.add_argument('--max-gap', type=float, default=MAX_SAMPLE_GAP_S, help='longest gap (s) one sample may cover')
+    parser.add_argument('--out', help='write the summary here (e.g. data/rollups.json to seed the server rollup store)')
+    parser.add_argument('--daily', action='store_true', help='print the daily summary')
+    args = parser.parse_args()
+
+    summary = run_scan(args.paths, workers=args.workers, chunk_bytes=int(args.chunk_mb * 1024 * 1024),
+                       aq_threshold=args.aq_threshold, max_gap=args.max_gap)
+    stats = summary['stats']
+    print(f"Scanned {stats['rows']} rows ({stats['bytes'] / 1e6:.1f} MB) in {stats['chunks']} chunks "
+          f"with {stats['workers']} workers: {stats['seconds']:.2f}s ({stats['mb_per_s']} MB/s)")
+    if args.daily:
+        for day in summary['daily']:
+            aq = day['metrics'].get('air_quality', {})
+            temp = day['metrics'].get('temperature', {})
+            print(f"{day['start'][:10]}  samples={day['samples']:>7}  "
+                  f"temp min/mean/max={temp.get('min')}/{temp.get('mean')}/{temp.get('max')}  "
+                  f"aq mean={aq.get('mean')}  aq>{args.aq_threshold:g}: {day['air_quality_above_min']} min")
+    if args.out:
+        save_rollups(summary, args.out)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,23 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, send_from_directory, g
+from werkzeug.utils import safe_join
 import paho.mqtt.client as mqtt
 import json
 import ssl
 import threading
+import bisect
+from collections import deque
+import zlib
+import hashlib
+import mimetypes
+import struct
+import numpy as np
 import pandas as pd
 from datetime import datetime, timezone, timedelta
-import os, random, math, csv
+import os, random, math, csv, glob, io
 from pathlib import Path
+from alerts import AlertEngine, load_rules
+from profiling import StackSampler
+import analytics
 
 app = Flask(__name__)
 app.jinja_env.globals['datetime'] = datetime
@@ -20,7 +31,40 @@ MQTT_PASSWORD = os.environ.get('MQTT_PASSWORD', 'Odyssey2')
 # --- Other Constants ---
 MQTT_TOPIC_TELEMETRY = os.environ.get('MQTT_TOPIC_TELEMETRY', 'rover/telemetry')
 MQTT_TOPIC_COMMAND = os.environ.get('MQTT_TOPIC_COMMAND', 'rover/command')
+MQTT_TOPIC_ALERTS = os.environ.get('MQTT_TOPIC_ALERTS', 'rover/alerts')
+MQTT_TOPIC_CLOCK = os.environ.get('MQTT_TOPIC_CLOCK', 'rover/clock')
+ALERT_RULES_FILE = os.environ.get('ALERT_RULES_FILE')
+# Commands not acted on by the rover within this many seconds are dropped
+COMMAND_TTL_S = float(os.environ.get('COMMAND_TTL_S', 2.0))
+# Sampling profiler: fraction of /api/* requests and on_message calls to
+# profile (0 disables it), stack sampling interval, optional folded-stack dump file
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+PROFILE_FILE = os.environ.get('PROFILE_FILE')
+# Rollup store of daily/hourly summaries (written by analytics.py --out or a
+# server-side scan), archived log segments to include in scans, scan workers
+ROLLUP_FILE = Path(os.environ.get('ROLLUP_FILE', 'data/rollups.json'))
+ANALYTICS_ARCHIVE_GLOB = os.environ.get('ANALYTICS_ARCHIVE_GLOB', '')
+ANALYTICS_WORKERS = int(os.environ.get('ANALYTICS_WORKERS', os.cpu_count() or 1))
 DATA_FILE = Path('data/odyssey_log.csv')
+LOG_COLUMNS = ['timestamp', 'power', 'mode', 'forward_distance', 'temperature', 'humidity', 'air_quality', 'rover']
+# Sparse time index granularity (one entry per N log rows) and export chunk size
+LOG_INDEX_STRIDE = int(os.environ.get('LOG_INDEX_STRIDE', 256))
+EXPORT_CHUNK_BYTES = 64 * 1024
+HISTORY_DEFAULT_LIMIT = 300
+HISTORY_MAX_LIMIT = 20000
+# Binary /api/history layout (little-endian): 16-byte header, Float64 epoch-ms
+# timestamps, then one Float32 block per column in SERIES_BINARY_COLUMNS order.
+SERIES_BINARY_MAGIC = b'ODYH'
+SERIES_BINARY_VERSION = 1
+SERIES_BINARY_COLUMNS = ['temperature_c', 'humidity_percent', 'air_quality_raw']
+SERIES_BINARY_MIMETYPE = 'application/vnd.odyssey.series'
+# /api/history bodies at least this large are gzipped for clients that accept it
+API_COMPRESS_MIN_BYTES = int(os.environ.get('API_COMPRESS_MIN_BYTES', 1024))
+# Fingerprinted static URLs (?v=<content hash>) are cached for a year
+STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Precompressed variants written by scripts/compress_static.py, in preference order
+STATIC_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
 
 # --- Global State & Data Logging ---
 rover_state = {
@@ -33,15 +77,66 @@ rover_state = {
     'air_quality_raw': 0,
 }
 state_lock = threading.Lock()
+# Encoded /api/data body built on ingest. It is replaced wholesale (one
+# reference assignment), never mutated, so readers need no lock.
+data_snapshot = None
+# Latest analytics summary; replaced wholesale when a scan finishes
+rollup_store = None
+analytics_job = {'running': False, 'started': None, 'error': None}
+analytics_lock = threading.Lock()
 
 mqtt_client = None
 mqtt_connected = threading.Event()
+# Last command sequence number and this process's boot id; see next_command_seq()
+command_seq = 0
+COMMAND_BOOT_ID = os.urandom(4).hex()
+command_seq_lock = threading.Lock()
+
+try:
+    alert_engine = AlertEngine(load_rules(ALERT_RULES_FILE))
+except Exception as e:
+    print('Error loading alert rules, using defaults:', e)
+    alert_engine = AlertEngine(load_rules())
+
+# Opt-in profiler; when disabled no hooks are installed at all
+profiler = StackSampler(PROFILE_SAMPLE_RATE, PROFILE_INTERVAL_MS / 1000.0, PROFILE_FILE) if PROFILE_SAMPLE_RATE > 0 else None
+
+if profiler is not None:
+    @app.before_request
+    def profile_begin():
+        if request.path.startswith('/api/') and request.endpoint != 'api_profile':
+            g.profile_token = profiler.begin(f'api:{request.endpoint}')
+
+    @app.teardown_request
+    def profile_end(exc):
+        profiler.end(g.pop('profile_token', None))
+
+def publish_alert(event):
+    if mqtt_client is not None and mqtt_connected.is_set():
+        mqtt_client.publish(MQTT_TOPIC_ALERTS, json.dumps(event), qos=1)
+
+alert_engine.add_listener(publish_alert)
 
 # --- Helpers ---
+def build_data_snapshot(state):
+    """Encode a rover state dict as the /api/data body (air quality shown in ppm)."""
+    state = dict(state)
+    # Replace air_quality_raw with air_quality_ppm for dashboard display
+    if 'air_quality_ppm' in state:
+        state['air_quality_raw'] = state['air_quality_ppm']
+    return app.json.dumps(state).encode('utf-8')
+
+def publish_fallback_snapshot(body):
+    # Only fills the gap before the first telemetry message; never replaces live data
+    global data_snapshot
+    with state_lock:
+        if data_snapshot is None:
+            data_snapshot = body
+
 def init_log_file():
     DATA_FILE.parent.mkdir(parents=True, exist_ok=True)
     if not DATA_FILE.exists():
-        df = pd.DataFrame(columns=['timestamp', 'power', 'mode', 'forward_distance', 'temperature', 'humidity', 'air_quality'])
+        df = pd.DataFrame(columns=LOG_COLUMNS)
         df.to_csv(DATA_FILE, index=False)
 
 def log_data(data):
@@ -54,11 +149,137 @@ def log_data(data):
             'temperature': data.get('temperature_c'),
             'humidity': data.get('humidity_percent'),
             'air_quality': data.get('air_quality_raw'),
+            'rover': data.get('rover_id'),
         }])
         new_log.to_csv(DATA_FILE, mode='a', header=not DATA_FILE.exists(), index=False)
     except Exception as e:
         print('Error logging data:', e)
 
+# --- Log Time Index ---
+def parse_log_timestamp(value):
+    """Parse a log timestamp ('YYYY-mm-dd HH:MM:SS UTC') to epoch seconds, or None."""
+    try:
+        dt = datetime.strptime(value.strip()[:19], '%Y-%m-%d %H:%M:%S')
+    except (ValueError, AttributeError):
+        return None
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+class LogIndex:
+    """Sparse, append-only index of (epoch_seconds, byte_offset) into the CSV log.
+
+    The log is written in time order, so every LOG_INDEX_STRIDE-th row is enough
+    to bisect to a starting offset; the index is extended incrementally from the
+    last indexed byte instead of rescanning the whole file.
+    """
+
+    def __init__(self, path, stride=LOG_INDEX_STRIDE):
+        self.path = path
+        self.stride = max(1, stride)
+        self.times = []
+        self.offsets = []
+        self._scanned = 0      # byte offset up to which rows have been indexed
+        self._rows = 0         # number of data rows seen so far
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        try:
+            size = self.path.stat().st_size
+        except OSError:
+            return
+        with self._lock:
+            if size < self._scanned:
+                # File was truncated or replaced — start over
+                self.times, self.offsets = [], []
+                self._scanned = self._rows = 0
+            if size == self._scanned:
+                return
+            with self.path.open('rb') as f:
+                f.seek(self._scanned)
+                offset = self._scanned
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # partial row still being written
+                    ts = parse_log_timestamp(line[:19].decode('ascii', 'ignore'))
+                    if ts is not None:
+                        if self._rows % self.stride == 0:
+                            self.times.append(ts)
+                            self.offsets.append(offset)
+                        self._rows += 1
+                    offset += len(line)
+                self._scanned = offset
+
+    def offset_for(self, start_ts):
+        """Byte offset at or before the first row with timestamp >= start_ts."""
+        self.refresh()
+        with self._lock:
+            if start_ts is None or not self.times:
+                return 0
+            i = bisect.bisect_left(self.times, start_ts) - 1
+            return self.offsets[i] if i >= 0 else 0
+
+    def locate_row(self, seq):
+        """(byte_offset, row_number) of the indexed row at or before data row `seq`."""
+        self.refresh()
+        with self._lock:
+            if seq <= 0 or not self.offsets:
+                return 0, 0
+            i = min(seq // self.stride, len(self.offsets) - 1)
+            return self.offsets[i], i * self.stride
+
+    def end_offset(self):
+        with self._lock:
+            return self._scanned
+
+    def snapshot(self):
+        """(row_count, end_offset) as of the last refresh; row_count is the next sequence number."""
+        with self._lock:
+            return self._rows, self._scanned
+
+log_index = LogIndex(DATA_FILE)
+
+def iter_log_rows(start_ts=None, end_ts=None, rover=None, stop=None):
+    """Yield (epoch_seconds, fields) for log rows in [start_ts, end_ts], starting from the indexed offset."""
+    offset = log_index.offset_for(start_ts)
+    if stop is None:
+        stop = log_index.end_offset()
+    with DATA_FILE.open('rb') as f:
+        f.seek(offset)
+        pos = offset
+        for line in f:
+            pos += len(line)
+            if pos > stop:
+                break
+            fields = next(csv.reader([line.decode('utf-8', 'replace')]), [])
+            ts = parse_log_timestamp(fields[0]) if fields else None
+            if ts is None:
+                continue  # header or malformed row
+            if start_ts is not None and ts < start_ts:
+                continue
+            if end_ts is not None and ts > end_ts:
+                break
+            fields += [''] * (len(LOG_COLUMNS) - len(fields))
+            if rover and fields[7] != rover:
+                continue
+            yield ts, fields
+
+def iter_log_rows_from(seq, stop):
+    """Yield fields for data rows with sequence number >= seq, up to byte offset `stop`."""
+    offset, row = log_index.locate_row(seq)
+    with DATA_FILE.open('rb') as f:
+        f.seek(offset)
+        pos = offset
+        for line in f:
+            pos += len(line)
+            if pos > stop:
+                break
+            fields = next(csv.reader([line.decode('utf-8', 'replace')]), [])
+            if not fields or parse_log_timestamp(fields[0]) is None:
+                continue  # not counted as a data row by the index either
+            if row >= seq:
+                fields += [''] * (len(LOG_COLUMNS) - len(fields))
+                yield fields
+            row += 1
+
 # --- MQTT Callbacks ---
 def on_connect(client, userdata, flags, reason_code, properties=None):
     try:
@@ -76,10 +297,25 @@ def on_connect(client, userdata, flags, reason_code, properties=None):
         print('Connected to MQTT broker')
         mqtt_connected.set()
         client.subscribe(MQTT_TOPIC_TELEMETRY)
+        client.subscribe(MQTT_TOPIC_CLOCK)
+
+def on_clock_request(client, payload):
+    # Echo the rover's request time with ours; the rover measures the round
+    # trip and derives the clock offset it ages commands with
+    reply = {'command': 'clock_sync', 't0': payload.get('t0'),
+             'server_time': datetime.now(timezone.utc).timestamp(), 'boot': COMMAND_BOOT_ID}
+    client.publish(MQTT_TOPIC_COMMAND, json.dumps(reply))
 
 def on_message(client, userdata, msg):
+    global data_snapshot
     try:
         payload = json.loads(msg.payload.decode())
+        if msg.topic == MQTT_TOPIC_CLOCK:
+            on_clock_request(client, payload)
+            return
+        # The rover sends partial updates (only fields that moved past their
+        # deadband, plus periodic full heartbeats); fields missing from the
+        # payload keep their last known value, so rover_state stays complete.
         with state_lock:
             rover_state['power'] = payload.get('power', rover_state['power'])
             rover_state['mode'] = payload.get('mode', rover_state['mode'])
@@ -88,28 +324,46 @@ def on_message(client, userdata, msg):
             rover_state['temperature_c'] = payload.get('temperature_c', rover_state['temperature_c'])
             rover_state['humidity_percent'] = payload.get('humidity_percent', rover_state['humidity_percent'])
             rover_state['air_quality_raw'] = payload.get('air_quality_raw', rover_state['air_quality_raw'])
+            if 'rover_id' in payload:
+                rover_state['rover_id'] = payload['rover_id']
+            # rover diagnostics (link, command mailbox, telemetry tx counts,
+            # control-loop profile, power transition latency) ride on heartbeats
+            for key in ('link', 'commands', 'tx', 'profile', 'transitions'):
+                if key in payload:
+                    rover_state[key] = payload[key]
             # Convert air_quality_raw to ppm using 3.5V reference
             raw_val = rover_state['air_quality_raw']
             try:
                 rover_state['air_quality_ppm'] = (float(raw_val) / 1023.0) * 3.5
             except Exception:
                 rover_state['air_quality_ppm'] = 0.0
+            state = dict(rover_state)
+        # Serialize outside the lock, then publish with a single swap
+        body = build_data_snapshot(state)
+        with state_lock:
+            data_snapshot = body
+        # A full sample is a heartbeat, or any message carrying every reading
+        # (e.g. scripts/replay_log.py and rovers without deadbands)
+        sensor_keys = ('forward_distance_cm', 'temperature_c', 'humidity_percent', 'air_quality_raw')
+        full = bool(payload.get('full')) or all(k in payload for k in sensor_keys)
+        alert_engine.evaluate(payload, full=full)
+        # Only log messages that carry sensor data: power/mode announcements
+        # (including the retained one re-delivered on every subscribe) would
+        # otherwise be logged as a copy of the previous row.
+        if not full and not any(k in payload for k in sensor_keys):
+            return
         # Only log if power is ON and all telemetry fields are strictly positive
-        power_val = payload.get('power')
+        # (checked on the reconstructed state, not the partial payload)
+        power_val = state.get('power')
         is_power_on = power_val in (True, 'ON', 'on', 'true', 1)
-        telemetry_fields = [
-            payload.get('forward_distance_cm'),
-            payload.get('temperature_c'),
-            payload.get('humidity_percent'),
-            payload.get('air_quality_raw')
-        ]
+        telemetry_fields = [state.get(k) for k in sensor_keys]
         def is_positive(x):
             try:
                 return float(x) > 0
             except Exception:
                 return False
         if is_power_on and all(is_positive(x) for x in telemetry_fields):
-            log_data(rover_state)
+            log_data(state)
     except Exception as e:
         print('Error processing telemetry message:', e)
 
@@ -118,7 +372,7 @@ def start_mqtt_client():
     global mqtt_client
     mqtt_client = mqtt.Client(client_id='MissionControl')
     mqtt_client.on_connect = on_connect
-    mqtt_client.on_message = on_message
+    mqtt_client.on_message = profiler.wrap('mqtt:on_message', on_message) if profiler else on_message
     mqtt_client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
     mqtt_client.tls_set(tls_version=ssl.PROTOCOL_TLS)
     try:
@@ -156,7 +410,7 @@ def read_series_from_csv(limit: int = 300):
         return None
     try:
         # Prefer pandas for robust CSV parsing; handle files missing the header row by supplying expected column names
-        expected = ['timestamp', 'power', 'mode', 'forward_distance', 'temperature', 'humidity', 'air_quality']
+        expected = LOG_COLUMNS
         try:
             df = pd.read_csv(DATA_FILE, parse_dates=['timestamp'], keep_default_na=False, na_values=[''])
         except Exception:
@@ -198,6 +452,207 @@ def read_series_from_csv(limit: int = 300):
         except Exception:
             return None
 
+def parse_time_arg(value):
+    """Accept epoch seconds or an ISO-8601 / log-style timestamp; naive values are UTC."""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    text = value.strip().replace('T', ' ').removesuffix('Z').removesuffix(' UTC')
+    dt = datetime.fromisoformat(text)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+def _to_number(value, cast=float):
+    try:
+        return cast(float(value))
+    except (TypeError, ValueError):
+        return None
+
+def log_row_to_dict(fields):
+    return {
+        'timestamp': fields[0],
+        'power': str(fields[1]).strip().upper() in {'1', 'TRUE', 'ON', 'YES'},
+        'mode': (fields[2] or '').lower(),
+        'forward_distance_cm': _to_number(fields[3]),
+        'temperature_c': _to_number(fields[4]),
+        'humidity_percent': _to_number(fields[5]),
+        'air_quality_raw': _to_number(fields[6], int),
+        'rover_id': fields[7] or None,
+    }
+
+def parse_since_arg(value):
+    """`since` is a row sequence number (integer below 1e9) or a timestamp (epoch seconds / ISO)."""
+    try:
+        number = float(value)
+    except ValueError:
+        return 'ts', parse_time_arg(value)
+    if number.is_integer() and number < 1e9:
+        return 'seq', max(int(number), 0)
+    return 'ts', number
+
+def read_series_since(kind, since, limit):
+    """Series of rows newer than a sequence number or timestamp, capped to the newest `limit` rows.
+
+    Only the sequence form is lossless. Log timestamps have 1-second
+    resolution, so with a timestamp cursor, rows logged later in the cursor's
+    own second are skipped. Incremental readers should follow `next_seq`.
+
+    Uses the log index to seek straight to the first needed row, so the cost is
+    proportional to the number of new rows rather than the size of the log.
+    """
+    series = {'labels': [], 'temperature_c': [], 'humidity_percent': [], 'air_quality_raw': []}
+    if not DATA_FILE.exists():
+        series['next_seq'] = 0
+        return series
+    log_index.refresh()
+    total, stop = log_index.snapshot()
+    if kind == 'seq':
+        rows = iter_log_rows_from(max(since, total - limit), stop)
+    else:
+        rows = deque((fields for ts, fields in iter_log_rows(since, stop=stop) if ts > since), maxlen=limit)
+    for fields in rows:
+        series['labels'].append(fields[0].strip())
+        series['temperature_c'].append(_to_number(fields[4]) or 0.0)
+        series['humidity_percent'].append(_to_number(fields[5]) or 0.0)
+        series['air_quality_raw'].append(_to_number(fields[6], int) or 0)
+    series['next_seq'] = total
+    return series
+
+def encode_series_binary(series):
+    """Pack a history series into the compact typed-array layout decoded by history.js.
+
+    Header: magic 'ODYH', u16 version, u16 column count, u32 row count, u32 next_seq
+    (the `since` cursor for the following incremental request; 0 when not sequenced).
+    Body: Float64[n] epoch-ms timestamps (NaN when unparseable), then Float32[n] per column.
+    The 16-byte header keeps the Float64 block 8-byte aligned for zero-copy views.
+    """
+    labels = series.get('labels') or []
+    count = len(labels)
+    try:
+        # Log timestamps are 'YYYY-mm-dd HH:MM:SS UTC': NumPy parses the first
+        # 19 characters in bulk, far faster than pandas' per-element 'mixed' mode
+        stamps = np.array([label[:19] for label in labels], dtype='datetime64[s]')
+        epoch_ms = stamps.astype('int64').astype('float64') * 1000.0
+        epoch_ms[np.isnat(stamps)] = np.nan
+    except (TypeError, ValueError):
+        # some label in another format: fall back to the slow general parser
+        stamps = pd.to_datetime(pd.Series(labels, dtype=object), utc=True, errors='coerce', format='mixed')
+        epoch_ms = ((stamps - pd.Timestamp(0, tz='UTC')) / pd.Timedelta(milliseconds=1)).to_numpy(dtype='float64', na_value=np.nan)
+    parts = [
+        SERIES_BINARY_MAGIC,
+        struct.pack('<HHII', SERIES_BINARY_VERSION, len(SERIES_BINARY_COLUMNS), count, series.get('next_seq', 0)),
+        np.asarray(epoch_ms, dtype='<f8').tobytes(),
+    ]
+    for column in SERIES_BINARY_COLUMNS:
+        parts.append(np.asarray(series.get(column) or [], dtype='<f4').tobytes())
+    return b''.join(parts)
+
+# --- Static Assets ---
+_asset_hashes = {}  # filename -> ((mtime_ns, size), digest)
+
+def asset_hash(filename):
+    """Short content hash of a static file, recomputed only when the file changes."""
+    path = safe_join(app.static_folder, filename)
+    try:
+        st = os.stat(path)
+    except (TypeError, OSError):
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _asset_hashes.get(filename)
+    if cached and cached[0] == key:
+        return cached[1]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    _asset_hashes[filename] = (key, digest)
+    return digest
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    # url_for('static', filename=...) -> /static/<filename>?v=<content hash>
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        digest = asset_hash(values['filename'])
+        if digest:
+            values['v'] = digest
+
+def serve_static(filename):
+    """Static files with precompressed br/gzip variants and immutable caching for fingerprinted URLs."""
+    response = None
+    source = safe_join(app.static_folder, filename)
+    if source and os.path.isfile(source):
+        source_mtime = os.stat(source).st_mtime
+        for encoding, suffix in STATIC_ENCODINGS:
+            variant = source + suffix
+            # Ignore variants older than the source (stale build output)
+            if request.accept_encodings[encoding] and os.path.isfile(variant) and os.stat(variant).st_mtime >= source_mtime:
+                mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                response = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+    if response is None:
+        response = send_from_directory(app.static_folder, filename)
+    response.vary.add('Accept-Encoding')
+    version = request.args.get('v')
+    if version and version == asset_hash(filename):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+app.view_functions['static'] = serve_static
+
+def compress_response(response):
+    """gzip a buffered response body of at least API_COMPRESS_MIN_BYTES if the client accepts gzip."""
+    response.vary.add('Accept-Encoding')
+    if response.direct_passthrough or 'Content-Encoding' in response.headers or not request.accept_encodings['gzip']:
+        return response
+    body = response.get_data()
+    if len(body) < API_COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(zlib.compress(body, 6, wbits=31))  # wbits=31 -> gzip container
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+# --- Analytics Rollups ---
+def load_rollup_store():
+    global rollup_store
+    try:
+        with ROLLUP_FILE.open('r', encoding='utf-8') as f:
+            rollup_store = json.load(f)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print('Error loading rollup store:', e)
+
+def analytics_sources():
+    """Archived segments (oldest first) followed by the live log."""
+    paths = sorted(glob.glob(ANALYTICS_ARCHIVE_GLOB)) if ANALYTICS_ARCHIVE_GLOB else []
+    if DATA_FILE.exists():
+        paths.append(str(DATA_FILE))
+    return paths
+
+def run_analytics_job(workers, aq_threshold):
+    global rollup_store
+    try:
+        summary = analytics.run_scan(analytics_sources(), workers=workers, aq_threshold=aq_threshold)
+        analytics.save_rollups(summary, ROLLUP_FILE)
+        rollup_store = summary
+        print(f"Analytics scan done: {summary['stats']}")
+    except Exception as e:
+        analytics_job['error'] = str(e)
+        print('Analytics scan failed:', e)
+    finally:
+        with analytics_lock:
+            analytics_job['running'] = False
+
+load_rollup_store()
+
 # --- Flask Routes ---
 @app.route('/')
 def index():
@@ -213,13 +668,11 @@ def history():
 
 @app.route('/api/data')
 def api_data():
-    with state_lock:
-        state = dict(rover_state)
-    # Replace air_quality_raw with air_quality_ppm for dashboard display
-    if 'air_quality_ppm' in state:
-        state['air_quality_raw'] = state['air_quality_ppm']
-    # Prefer live telemetry; if not available try CSV. Do NOT fabricate random data.
-    if not state['last_seen'] or state['last_seen'] == '—':
+    # Lock-free: hand out the bytes prepared by the last on_message
+    body = data_snapshot
+    if body is None:
+        # No live telemetry yet: fall back to the last logged row. Do NOT
+        # fabricate random data. Cached until the first message replaces it.
         latest = read_latest_from_csv()
         if latest:
             # Replace air_quality_raw with ppm if possible
@@ -228,26 +681,191 @@ def api_data():
                 latest['air_quality_raw'] = (float(raw_val) / 1023.0) * 3.5
             except Exception:
                 latest['air_quality_raw'] = 0.0
-            return jsonify(latest)
-        # No live telemetry and no CSV available — return the current in-memory state (may be defaults)
-        return jsonify(state)
-    return jsonify(state)
+            body = app.json.dumps(latest).encode('utf-8')
+        else:
+            # No live telemetry and no CSV available — the in-memory defaults
+            with state_lock:
+                body = build_data_snapshot(rover_state)
+        publish_fallback_snapshot(body)
+    return Response(body, mimetype='application/json')
 
 @app.route('/api/history')
 def api_history():
-    series = read_series_from_csv()
-    if series:
-        return jsonify(series)
-    # No stored history available — return an empty series (no synthetic generation)
-    return jsonify({'labels': [], 'temperature_c': [], 'humidity_percent': [], 'air_quality_raw': []})
+    limit = min(max(request.args.get('limit', HISTORY_DEFAULT_LIMIT, type=int), 1), HISTORY_MAX_LIMIT)
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            kind, since = parse_since_arg(since)
+        except ValueError as e:
+            return jsonify({'ok': False, 'error': f'invalid since: {e}'}), 400
+        series = read_series_since(kind, since, limit)
+    else:
+        series = read_series_from_csv(limit)
+    if not series:
+        # No stored history available — return an empty series (no synthetic generation)
+        series = {'labels': [], 'temperature_c': [], 'humidity_percent': [], 'air_quality_raw': []}
+    if request.args.get('format') == 'bin':
+        return compress_response(Response(encode_series_binary(series), mimetype=SERIES_BINARY_MIMETYPE))
+    return compress_response(jsonify(series))
+
+def _export_chunks(rows, fmt):
+    # csv.writer re-quotes fields (e.g. rover ids containing commas or quotes)
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    if fmt == 'csv':
+        writer.writerow(LOG_COLUMNS)
+    for _, fields in rows:
+        if fmt == 'csv':
+            writer.writerow(fields[:len(LOG_COLUMNS)])
+        else:
+            buf.write(json.dumps(log_row_to_dict(fields)) + '\n')
+        if buf.tell() >= EXPORT_CHUNK_BYTES:
+            yield buf.getvalue().encode('utf-8')
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode('utf-8')
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.route('/api/export')
+def api_export():
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'ok': False, 'error': 'format must be csv or ndjson'}), 400
+    try:
+        start_ts = parse_time_arg(request.args.get('start'))
+        end_ts = parse_time_arg(request.args.get('end'))
+    except ValueError as e:
+        return jsonify({'ok': False, 'error': f'invalid time range: {e}'}), 400
+    if not DATA_FILE.exists():
+        return jsonify({'ok': False, 'error': 'no telemetry log'}), 404
+    rover = request.args.get('rover') or None
+
+    stream = _export_chunks(iter_log_rows(start_ts, end_ts, rover), fmt)
+    headers = {'Content-Disposition': f'attachment; filename=odyssey_export.{fmt}', 'Vary': 'Accept-Encoding'}
+    if request.accept_encodings['gzip']:
+        stream = _gzip_stream(stream)
+        headers['Content-Encoding'] = 'gzip'
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream, mimetype=mimetype, headers=headers)
+
+@app.route('/api/alerts')
+def api_alerts():
+    since = request.args.get('since', 0, type=int)
+    return jsonify({
+        'active': alert_engine.active_alerts(),
+        'events': alert_engine.events_since(since),
+        'stats': alert_engine.stats(),
+        'rules': [r.describe() for r in alert_engine.rules],
+    })
+
+@app.route('/api/alerts/stream')
+def api_alerts_stream():
+    last_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('since', 0, type=int)
+    if last_id > alert_engine.last_seq():
+        # Last-Event-ID from before a server restart: replay from the start
+        last_id = 0
+
+    def stream(last_id):
+        yield 'retry: 3000\n\n'
+        while True:
+            events = alert_engine.wait_for_events(last_id, timeout=15)
+            if not events:
+                yield ': keepalive\n\n'
+                continue
+            for event in events:
+                last_id = event['id']
+                yield f"id: {event['id']}\nevent: alert\ndata: {json.dumps(event)}\n\n"
+
+    return Response(stream(last_id), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/analytics')
+def api_analytics():
+    """Daily (default) or hourly rollups from the store, optionally limited to [start, end]."""
+    period = request.args.get('period', 'daily')
+    if period not in ('daily', 'hourly'):
+        return jsonify({'ok': False, 'error': 'period must be daily or hourly'}), 400
+    try:
+        start_ts = parse_time_arg(request.args.get('start'))
+        end_ts = parse_time_arg(request.args.get('end'))
+    except ValueError as e:
+        return jsonify({'ok': False, 'error': f'invalid time range: {e}'}), 400
+    store = rollup_store
+    if store is None:
+        return jsonify({'ok': False, 'error': 'no rollups yet (POST /api/analytics/scan or run analytics.py --out)', 'job': analytics_job}), 404
+    rows = [
+        r for r in store.get(period, [])
+        if (start_ts is None or r['ts'] >= start_ts) and (end_ts is None or r['ts'] <= end_ts)
+    ]
+    return compress_response(jsonify({
+        'period': period,
+        'generated': store.get('generated'),
+        'sources': store.get('sources'),
+        'aq_threshold': store.get('aq_threshold'),
+        'stats': store.get('stats'),
+        'rows': rows,
+        'job': analytics_job,
+    }))
+
+@app.route('/api/analytics/scan', methods=['POST'])
+def api_analytics_scan():
+    """Start a background parallel scan of the logs that replaces the rollup store when done."""
+    options = request.get_json(silent=True) or {}
+    try:
+        workers = int(options.get('workers', ANALYTICS_WORKERS))
+        aq_threshold = float(options.get('aq_threshold', analytics.AQ_THRESHOLD))
+    except (TypeError, ValueError) as e:
+        return jsonify({'ok': False, 'error': f'invalid option: {e}'}), 400
+    with analytics_lock:
+        if analytics_job['running']:
+            return jsonify({'ok': False, 'error': 'scan already running', 'job': analytics_job}), 409
+        analytics_job.update(running=True, started=datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S %Z'), error=None)
+    threading.Thread(target=run_analytics_job, args=(workers, aq_threshold), daemon=True).start()
+    return jsonify({'ok': True, 'job': analytics_job}), 202
+
+@app.route('/api/profile')
+def api_profile():
+    """Aggregated server profile: folded stacks (flame graph input) or ?format=json summary; ?reset=1 clears it."""
+    if profiler is None:
+        return jsonify({'ok': False, 'error': 'profiling disabled (set PROFILE_SAMPLE_RATE)'}), 404
+    if request.args.get('format') == 'json':
+        response = jsonify(profiler.summary())
+    else:
+        response = Response(profiler.folded(), mimetype='text/plain')
+    if request.args.get('reset') == '1':
+        profiler.reset()
+    return response
+
+def next_command_seq():
+    # Counts up from 1 per server process; COMMAND_BOOT_ID tells the rover
+    # when a restart starts the numbering over, so no wall clock is involved.
+    global command_seq
+    with command_seq_lock:
+        command_seq += 1
+        return command_seq
 
 @app.route('/command', methods=['POST'])
 def command():
     payload = request.get_json(silent=True) or request.form.to_dict()
     if mqtt_client is None or not mqtt_connected.is_set():
         return jsonify({'ok': False, 'error': 'MQTT not connected'}), 503
+    # The rover ages commands from `sent` against its own estimate of the
+    # clock offset, so the two clocks need not agree
+    payload['boot'] = COMMAND_BOOT_ID
+    payload['seq'] = next_command_seq()
+    payload['sent'] = round(datetime.now(timezone.utc).timestamp(), 3)
+    payload['ttl'] = COMMAND_TTL_S
     try:
-        mqtt_client.publish(MQTT_TOPIC_COMMAND, json.dumps(payload))
+        # QoS 1 so the broker queues commands for the rover's persistent session
+        # while its link is briefly down
+        mqtt_client.publish(MQTT_TOPIC_COMMAND, json.dumps(payload), qos=1)
         return jsonify({'ok': True, 'received': payload})
     except Exception as e:
         return jsonify({'ok': False, 'error': str(e)}), 500
@@ -0,0 +1,134 @@
+# profiling.py
+# Opt-in sampling profiler for Mission Control.
+#
+# A fraction of calls (Flask /api/* requests, MQTT on_message) is "tracked":
+# while a tracked call runs, a background thread samples its Python stack every
+# few milliseconds via sys._current_frames(). Samples are aggregated as folded
+# stacks ("label;outer;...;inner count" per line), the input format of
+# flamegraph.pl and speedscope. Untracked calls only pay for one random() draw,
+# and when profiling is disabled nothing is installed at all.
+
+import os
+import sys
+import time
+import random
+import threading
+from collections import Counter
+
+
+class StackSampler:
+    def __init__(self, rate, interval=0.005, dump_path=None, dump_every=60.0):
+        self.rate = float(rate)
+        self.interval = float(interval)
+        self.dump_path = dump_path
+        self.dump_every = float(dump_every)
+        self.stacks = Counter()     # folded stack -> sample count
+        self.calls = Counter()      # label -> tracked calls
+        self.wall = Counter()       # label -> tracked wall seconds
+        self._active = {}           # thread id -> label
+        self._lock = threading.Lock()
+        self._thread = None
+        self._wake = threading.Event()
+
+    def begin(self, label):
+        """Start tracking the calling thread with probability `rate`; returns a token for end()."""
+        if random.random() >= self.rate:
+            return None
+        ident = threading.get_ident()
+        with self._lock:
+            self._active[ident] = label
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return (ident, label, time.perf_counter())
+
+    def end(self, token):
+        if token is None:
+            return
+        ident, label, t0 = token
+        with self._lock:
+            self._active.pop(ident, None)
+            self.calls[label] += 1
+            self.wall[label] += time.perf_counter() - t0
+
+    def wrap(self, label, fn):
+        """Wrap a callback (e.g. on_message) so a sample of its invocations is tracked."""
+        def tracked(*args, **kwargs):
+            token = self.begin(label)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.end(token)
+        return tracked
+
+    def _run(self):
+        last_dump = time.monotonic()
+        while True:
+            with self._lock:
+                active = dict(self._active)
+            if not active:
+                # Idle until the next tracked call instead of polling. Clear
+                # the wake flag before re-checking so a begin() in between
+                # is not missed.
+                self._wake.clear()
+                with self._lock:
+                    idle = not self._active
+                if idle:
+                    self._wake.wait(timeout=self.dump_every)
+            else:
+                frames = sys._current_frames()
+                with self._lock:
+                    for ident, label in active.items():
+                        frame = frames.get(ident)
+                        if frame is not None:
+                            self.stacks[self._fold(label, frame)] += 1
+                time.sleep(self.interval)
+            if self.dump_path and time.monotonic() - last_dump >= self.dump_every:
+                last_dump = time.monotonic()
+                self.dump()
+
+    @staticmethod
+    def _fold(label, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        names.append(label)
+        return ';'.join(reversed(names))
+
+    def folded(self):
+        with self._lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def summary(self):
+        with self._lock:
+            return {
+                'rate': self.rate,
+                'interval_ms': self.interval * 1000.0,
+                'samples': sum(self.stacks.values()),
+                'calls': {
+                    label: {'tracked': n, 'mean_ms': self.wall[label] / n * 1000.0}
+                    for label, n in self.calls.items()
+                },
+            }
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.calls.clear()
+            self.wall.clear()
+
+    def dump(self, path=None):
+        """Write the folded stacks to `path` (default: dump_path) atomically."""
+        path = path or self.dump_path
+        if not path:
+            return
+        tmp = f'{path}.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(self.folded())
+            os.replace(tmp, path)
+        except OSError as e:
+            print('Profile dump failed:', e)
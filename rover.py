@@ -5,15 +5,22 @@ try:
     import paho.mqtt.client as mqtt
 except Exception as e:
     raise ImportError("paho-mqtt is required. Install with 'pip install paho-mqtt'") from e
+import os
 import time
 import json
 import ssl
+import random
 import threading
+import queue
+from collections import deque
 
 # Try to import Raspberry Pi specific libraries. If unavailable (development
 # machine), provide lightweight mocks so the rover logic and MQTT can be
 # exercised without hardware.
 HARDWARE_AVAILABLE = True
+# Optional simulated hardware (rover_sim.SimHardware) driving the mocks below;
+# see install_sim().
+SIM = None
 try:
     import RPi.GPIO as GPIO
     import board
@@ -29,11 +36,11 @@ except Exception as _e:
         def __init__(self, pin, freq):
             self.pin = pin
         def start(self, duty):
-            pass
+            if SIM: SIM.set_duty(self.pin, duty)
         def ChangeDutyCycle(self, d):
-            pass
+            if SIM: SIM.set_duty(self.pin, d)
         def stop(self):
-            pass
+            if SIM: SIM.set_duty(self.pin, 0)
 
     class _DummyGPIO:
         BCM = 0
@@ -51,22 +58,24 @@ except Exception as _e:
         def PWM(self, pin, freq):
             return _DummyPWM(pin, freq)
         def output(self, pins, value):
-            pass
+            if SIM: SIM.output(pins, value)
         def input(self, pin):
-            # simulate no echo for ultrasonic
-            return 0
+            # simulate no echo for ultrasonic unless a simulated world is installed
+            return SIM.input(pin) if SIM else 0
         def cleanup(self):
             pass
 
     GPIO = _DummyGPIO()
 
-    class board:
+    class _DummyBoard:
         SCL = 'SCL'
         SDA = 'SDA'
         # allow getattr(board, 'D7') style access
         def __getattr__(self, name):
             return name
 
+    board = _DummyBoard()
+
     class busio:
         class I2C:
             def __init__(self, scl, sda):
@@ -79,10 +88,10 @@ except Exception as _e:
                 self._hum = None
             @property
             def temperature(self):
-                return None
+                return SIM.temperature() if SIM else None
             @property
             def humidity(self):
-                return None
+                return SIM.humidity() if SIM else None
             def exit(self):
                 pass
 
@@ -94,7 +103,17 @@ except Exception as _e:
 
     class AnalogIn:
         def __init__(self, ads, channel):
-            self.value = 32000
+            pass
+        @property
+        def value(self):
+            return SIM.analog_value() if SIM else 32000
+
+def install_sim(hardware):
+    """Route the mock GPIO/PWM/sensor classes to a simulated world (rover_sim.SimHardware)."""
+    global SIM
+    if HARDWARE_AVAILABLE:
+        raise RuntimeError("Simulation is only available when the hardware libraries are missing")
+    SIM = hardware
 
 # --- Pin Definitions (BCM Mode) ---
 # L298N Motor Driver
@@ -123,6 +142,13 @@ MQTT_PASSWORD = "Odyssey2"
 # --- Other Constants ---
 MQTT_TOPIC_TELEMETRY = "rover/telemetry"
 MQTT_TOPIC_COMMAND = "rover/command"
+# Clock sync requests; the server answers with a "clock_sync" command
+MQTT_TOPIC_CLOCK = "rover/clock"
+# Keepalive bounds how long a silent link drop goes unnoticed; reconnects use
+# jittered exponential backoff starting at MQTT_BACKOFF_BASE seconds.
+MQTT_KEEPALIVE = 15
+MQTT_BACKOFF_BASE = 0.1
+MQTT_BACKOFF_MAX = 30.0
 SAFE_DISTANCE_CM = 25
 # If True, the left motor wiring/orientation is reversed relative to the
 # right motor. Set to True if left wheels spin opposite to right for the
@@ -134,9 +160,216 @@ COMMAND_DURATION = 3.0
 # commands control the right motor hardware and vice-versa). Enable this
 # if your motor wiring maps channels to the opposite sides.
 SWAP_MOTORS = True
+# Telemetry compression: a numeric field is only re-published once it moves at
+# least this far from the value last sent; other fields (mode, power) whenever
+# they change. A full sample goes out every TELEMETRY_HEARTBEAT_S regardless.
+TELEMETRY_DEADBANDS = {
+    "temperature_c": 0.2,
+    "humidity_percent": 0.5,
+    "air_quality_raw": 200,
+    "forward_distance_cm": 2.0,
+}
+TELEMETRY_HEARTBEAT_S = 5.0
+# Diagnostics that change every tick; sent with heartbeats only
+HEARTBEAT_ONLY_FIELDS = ("link", "commands", "tx", "profile", "transitions")
+# Wheel duty cycles (left, right) for manual/assisted movement commands
+DRIVE_SPEEDS = {"forward": (80, 80), "backward": (-80, -80), "left": (-70, 70), "right": (70, -70)}
+# Per-tick phase timings of the control loop (sense/publish/decide/actuate),
+# enabled with ROVER_PROFILE=1; the summary is written to ROVER_PROFILE_FILE
+# every ROVER_PROFILE_DUMP_TICKS ticks and sent with telemetry heartbeats.
+ROVER_PROFILE = os.environ.get("ROVER_PROFILE", "").lower() in ("1", "true", "yes")
+ROVER_PROFILE_FILE = os.environ.get("ROVER_PROFILE_FILE", "rover_profile.json")
+ROVER_PROFILE_DUMP_TICKS = 600
+# Movement commands understood by the control loop
+MOVE_COMMANDS = ("forward", "backward", "left", "right", "stop")
+# Commands that go stale: a late drive command is dropped. Everything else
+# (stop, power and mode changes) is always applied, however late it arrives.
+EXPIRING_COMMANDS = ("forward", "backward", "left", "right")
+# Server clock offset: re-measured this often over a request/reply round trip;
+# replies slower than CLOCK_SYNC_MAX_RTT_S (e.g. queued while offline) are ignored.
+CLOCK_SYNC_INTERVAL_S = 60.0
+CLOCK_SYNC_RETRY_S = 2.0
+CLOCK_SYNC_MAX_RTT_S = 1.0
+# Server boot ids remembered so commands from an earlier boot stay stale
+RETIRED_BOOTS = 16
+
+class TickProfiler:
+    """Accumulates wall time per control-loop phase, per tick."""
+
+    def __init__(self, path=None, dump_ticks=ROVER_PROFILE_DUMP_TICKS):
+        self.path = path
+        self.dump_ticks = dump_ticks
+        self.ticks = 0
+        self.phases = {}    # phase -> [ticks, total_s, max_s]
+        self._tick = {}
+        self._t = 0.0
+
+    def start(self):
+        """(Re)start the phase timer, e.g. at the top of a tick or after a deliberate sleep."""
+        self._t = time.perf_counter()
+
+    def mark(self, phase):
+        """Charge the time since the last start()/mark() to `phase`."""
+        now = time.perf_counter()
+        self._tick[phase] = self._tick.get(phase, 0.0) + (now - self._t)
+        self._t = now
+
+    def end_tick(self):
+        for phase, dt in self._tick.items():
+            stats = self.phases.setdefault(phase, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += dt
+            if dt > stats[2]:
+                stats[2] = dt
+        self._tick.clear()
+        self.ticks += 1
+        if self.path and self.ticks % self.dump_ticks == 0:
+            self.dump()
+
+    def summary(self):
+        return {
+            phase: {"ticks": n, "mean_ms": round(total / n * 1000.0, 3), "max_ms": round(peak * 1000.0, 3)}
+            for phase, (n, total, peak) in self.phases.items()
+        }
+
+    def dump(self):
+        try:
+            with open(self.path, "w") as f:
+                json.dump({"ticks": self.ticks, "phases": self.summary()}, f, indent=2)
+        except OSError as e:
+            print(f"Profile dump failed: {e}")
+
+class CommandMailbox:
+    """Latest-wins, single-slot mailbox between the MQTT thread and the control loop.
+
+    Commands carry a server boot id, a per-boot `seq`, the server's send time
+    `sent` and a `ttl`. Anything not newer than the last accepted seq of the
+    current boot, or from an earlier boot, is stale; a drive command older than
+    its ttl is expired; both are dropped and counted.
+
+    The rover has no RTC and its clock may be off by seconds, so command age is
+    measured on the monotonic clock plus an offset to the server clock taken
+    from a fresh request/reply round trip (see clock_request/clock_sync). Until
+    such a measurement exists, drive commands are dropped as unsynced: a
+    backlog replayed by the broker on reconnect cannot vouch for its own age.
+
+    Only the MQTT thread admits, posts and syncs; only the control loop takes.
+    The slot is a single tuple replaced by one attribute assignment and the
+    reader remembers the last tuple it consumed instead of clearing the slot,
+    so neither side needs a lock.
+    """
 
-class Rover:
     def __init__(self):
+        self._slot = None       # (seq, command, local monotonic deadline)
+        self._taken = None      # last slot consumed by the control loop
+        self._boot = None
+        self._retired = deque(maxlen=RETIRED_BOOTS)
+        self._last_seq = None
+        self._offset = None     # server time - time.monotonic()
+        self._synced_at = None
+        self._sync_t0 = None    # outstanding request
+        self._resync = False
+        # Each counter has a single writing thread: late on the control loop,
+        # the rest on the MQTT thread.
+        self.counters = {"accepted": 0, "stale": 0, "expired": 0, "unsynced": 0, "late": 0,
+                         "superseded": 0, "preempted": 0}
+
+    def sync_due(self, now):
+        if self._sync_t0 is not None and now - self._sync_t0 < CLOCK_SYNC_RETRY_S:
+            return False
+        return self._resync or self._offset is None or now - self._synced_at >= CLOCK_SYNC_INTERVAL_S
+
+    def clock_request(self, now):
+        """Payload for a clock sync request sent at monotonic time `now`."""
+        self._sync_t0 = now
+        return {"t0": now}
+
+    def clock_sync(self, payload, now):
+        """Apply a clock_sync reply; only the answer to the outstanding request counts."""
+        t0, server_time = payload.get("t0"), payload.get("server_time")
+        if t0 is None or server_time is None or t0 != self._sync_t0:
+            return False
+        self._sync_t0 = None
+        if now - t0 > CLOCK_SYNC_MAX_RTT_S:
+            return False
+        # NTP-style: the server read its clock about halfway through the round trip
+        self._offset = server_time - (t0 + now) / 2.0
+        self._synced_at = now
+        self._resync = False
+        return True
+
+    def admit(self, command, payload, now):
+        """Ordering and age check shared by every command.
+
+        `now` is time.monotonic() at receipt. Returns the command's deadline on
+        the monotonic clock (inf if it never expires), or None if it must be
+        dropped.
+        """
+        boot = payload.get("boot")
+        if boot != self._boot:
+            if boot in self._retired:
+                # queued before a server restart we already know about
+                self.counters["stale"] += 1
+                return None
+            # server restarted: its seq numbering starts over and its clock
+            # may have stepped, so measure the offset again
+            if self._boot is not None:
+                self._retired.append(self._boot)
+            self._boot = boot
+            self._last_seq = None
+            self._resync = True
+        seq = payload.get("seq")
+        if seq is not None:
+            if self._last_seq is not None and seq <= self._last_seq:
+                self.counters["stale"] += 1
+                return None
+            self._last_seq = seq
+        if command not in EXPIRING_COMMANDS:
+            return float("inf")
+        sent, ttl = payload.get("sent"), payload.get("ttl")
+        if sent is None or ttl is None:
+            return float("inf")
+        if self._offset is None:
+            self.counters["unsynced"] += 1
+            return None
+        deadline = sent + ttl - self._offset
+        if now > deadline:
+            self.counters["expired"] += 1
+            return None
+        return deadline
+
+    def post(self, command, seq=None, deadline=None):
+        pending = self._slot
+        if pending is not None and pending is not self._taken:
+            # the loop never saw the previous command: latest wins
+            self.counters["superseded"] += 1
+            if command == "stop" and pending[1] != "stop":
+                self.counters["preempted"] += 1
+        self._slot = (seq, command, deadline)
+        self.counters["accepted"] += 1
+
+    def take(self, now):
+        """Return the newest unconsumed command, or None if there is nothing new to act on.
+
+        `now` is time.monotonic(), like the deadlines returned by admit().
+        """
+        slot = self._slot
+        if slot is None or slot is self._taken:
+            return None
+        self._taken = slot
+        seq, command, deadline = slot
+        if deadline is not None and now > deadline:
+            # delivered in time but the loop did not get to it before the deadline
+            self.counters["late"] += 1
+            return None
+        return command
+
+class Rover:
+    def __init__(self, clock=None, connect_mqtt=True):
+        # Time source for the control loop and sensor timing: the `time` module
+        # on hardware, a virtual clock (rover_sim.VirtualClock) in simulation.
+        self.clock = clock if clock is not None else time
+        self.connect_mqtt = connect_mqtt
         # GPIO Setup
         GPIO.setmode(GPIO.BCM)
         GPIO.setwarnings(False)
@@ -170,65 +403,129 @@ class Rover:
 
         # Lightweight lock to protect state accessed from MQTT callbacks and main loop
         self.state_lock = threading.Lock()
-        # Track manual command timing: (command_str, start_time)
-        self.command_timer = None
+        # Movement commands travel from on_message to the control loop through
+        # the mailbox; last_command and command_started are owned by the loop.
+        self.mailbox = CommandMailbox()
+        # Clock time the current command started executing (manual auto-stop)
+        self.command_started = None
 
         # MQTT Client Setup (paho-mqtt is required)
-        self.mqtt_client = mqtt.Client(client_id="OdysseyRover")
+        # clean_session=False keeps the broker-side session (subscriptions and
+        # queued QoS 1 commands) across reconnects for this fixed client id.
+        self.mqtt_client = mqtt.Client(client_id="OdysseyRover", clean_session=False)
         # Last-Will: if rover drops unexpectedly, broker will publish OFF retained state
         self.mqtt_client.will_set(MQTT_TOPIC_TELEMETRY, payload=json.dumps({"power": False, "power_state": "OFF", "mode": self.mode}), qos=1, retain=True)
         self.mqtt_client.on_connect = self.on_connect
         self.mqtt_client.on_message = self.on_message
         self.mqtt_client.on_disconnect = self.on_disconnect
+        # The network loop runs in _mqtt_manager rather than paho's loop_start(),
+        # so register a no-op write hook: publishes from other threads then only
+        # queue the packet and wake the manager, which does all socket writes.
+        self.mqtt_client.on_socket_register_write = lambda client, userdata, sock: None
         self.mqtt_client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
         self.mqtt_client.tls_set(tls_version=ssl.PROTOCOL_TLS)
 
-        # Try to connect the MQTT client immediately so the rover can receive
-        # `power_on` commands even when internal power_state is OFF. Subscriptions
-        # are performed in on_connect.
-        try:
-            self.mqtt_client.connect(MQTT_BROKER_HOSTNAME, MQTT_BROKER_PORT, 60)
-            # start network loop in background
-            self.mqtt_client.loop_start()
-        except Exception as e:
-            print(f"Initial MQTT connect failed (will retry on power_on/disconnect): {e}")
-
-        # Reconnect control
-        self.reconnect_thread = None
-        self._reconnect_stop = threading.Event()
+        # Connection manager state. A single thread (_mqtt_manager) owns
+        # connect, the network loop and reconnects, so paho's own loop and a
+        # separate reconnect thread can never race each other.
+        self.mqtt_connected = threading.Event()
+        self._mqtt_stop = threading.Event()
+        self._mqtt_thread = None
+        self._mqtt_attempt = 0
+        # Link metrics (monotonic seconds), reported with telemetry
+        self._outage_start = None          # when the last connection was lost
+        self._awaiting_first_command = False
+        self.link_metrics = {"connects": 0, "reconnect_s": None, "first_command_s": None}
+        # Telemetry deadband state: values last published and when the last
+        # full sample (heartbeat) went out. Both are owned by the control loop;
+        # other threads request a full sample by setting _force_full.
+        self._last_sent = None
+        self._last_heartbeat = 0.0
+        self._force_full = False
+        self.tx_counts = {"samples": 0, "published": 0}
+        # Power transitions: _power_lock serializes whole transitions (state
+        # flip + motor/LED changes) so state_lock is only held for the flip
+        # itself; announcements go out from a background task thread.
+        self._power_lock = threading.Lock()
+        self._tasks = queue.Queue()
+        self._task_thread = None
+        self._last_announce = None
+        # Latest transition latencies in ms: command -> state applied, and
+        # state applied -> retained announcement queued
+        self.transition_metrics = {"power_on_ms": None, "power_off_ms": None, "announce_ms": None}
+        # Control-loop phase timings (None unless ROVER_PROFILE is set)
+        self.profiler = TickProfiler(ROVER_PROFILE_FILE) if ROVER_PROFILE else None
+
+        # Connect immediately so the rover can receive `power_on` commands even
+        # when internal power_state is OFF. Subscriptions happen in on_connect.
+        if self.connect_mqtt:
+            self.start_mqtt()
     # No hardware power button on rover; power controls via code or MQTT
 
-    def on_disconnect(self, client, userdata, rc):
-        print(f"MQTT disconnected (rc={rc})")
-        # If disconnect was unexpected, try to reconnect in background so the
-        # dashboard can still send a `power_on` command even while the rover
-        # is powered OFF. Start the reconnect thread unconditionally on
-        # unexpected disconnects.
-        if rc != 0:
-            # start reconnect thread if not already running
-            if not self.reconnect_thread or not self.reconnect_thread.is_alive():
-                self._reconnect_stop.clear()
-                self.reconnect_thread = threading.Thread(target=self._reconnect_loop, daemon=True)
-                self.reconnect_thread.start()
-
-    def _reconnect_loop(self):
-        backoff = 1.0
-        # Keep trying to reconnect until stopped explicitly or reconnect
-        # succeeds. We intentionally do NOT bail out when power_state is
-        # OFF so the rover remains reachable from the dashboard.
-        while not self._reconnect_stop.is_set():
+    def start_mqtt(self):
+        """Start the connection manager thread (idempotent)."""
+        if self._mqtt_thread and self._mqtt_thread.is_alive():
+            return
+        self._mqtt_stop.clear()
+        self._outage_start = time.monotonic()
+        self._mqtt_thread = threading.Thread(target=self._mqtt_manager, daemon=True)
+        self._mqtt_thread.start()
+
+    def _backoff_delay(self):
+        # Exponential backoff with "equal jitter": the first retry after a drop
+        # happens within MQTT_BACKOFF_BASE seconds, and a fleet of rovers
+        # reconnecting after a broker blip spreads out instead of stampeding.
+        ceiling = min(MQTT_BACKOFF_MAX, MQTT_BACKOFF_BASE * (2 ** self._mqtt_attempt))
+        self._mqtt_attempt += 1
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def _mqtt_manager(self):
+        # Keep the link up for as long as the process runs. We intentionally do
+        # NOT bail out when power_state is OFF so the rover remains reachable
+        # from the dashboard.
+        first = True
+        while not self._mqtt_stop.is_set():
             try:
-                print(f"Attempting MQTT reconnect (backoff={backoff}s)...")
-                self.mqtt_client.reconnect()
-                print("MQTT reconnect successful")
-                # on successful reconnect, stop loop
-                break
+                if first:
+                    self.mqtt_client.connect(MQTT_BROKER_HOSTNAME, MQTT_BROKER_PORT, MQTT_KEEPALIVE)
+                    first = False
+                else:
+                    self.mqtt_client.reconnect()
             except Exception as e:
-                print(f"MQTT reconnect failed: {e}")
-                time.sleep(backoff)
-                backoff = min(backoff * 2, 30)
-        # mark stopped
-        self._reconnect_stop.set()
+                delay = self._backoff_delay()
+                print(f"MQTT connect failed: {e} (retrying in {delay:.2f}s)")
+                self._mqtt_stop.wait(delay)
+                continue
+            rc = mqtt.MQTT_ERR_SUCCESS
+            while rc == mqtt.MQTT_ERR_SUCCESS and not self._mqtt_stop.is_set():
+                rc = self.mqtt_client.loop(timeout=0.1)
+                now = time.monotonic()
+                if self.mqtt_connected.is_set() and self.mailbox.sync_due(now):
+                    self.mqtt_client.publish(MQTT_TOPIC_CLOCK, json.dumps(self.mailbox.clock_request(now)))
+            if self._mqtt_stop.is_set():
+                break
+            self._on_link_lost()
+            if self._mqtt_attempt:
+                # CONNACK refused or the link dropped again straight away
+                self._mqtt_stop.wait(self._backoff_delay())
+            else:
+                self._mqtt_attempt = 1
+
+    def stop_mqtt(self):
+        self._mqtt_stop.set()
+        if self._mqtt_thread:
+            self._mqtt_thread.join(timeout=2)
+
+    def _on_link_lost(self):
+        if self.mqtt_connected.is_set():
+            self.mqtt_connected.clear()
+            self._outage_start = time.monotonic()
+
+    def on_disconnect(self, client, userdata, rc):
+        print(f"MQTT disconnected (rc={rc})")
+        # Reconnecting is handled by _mqtt_manager once its network loop
+        # reports the lost connection; just record when the outage started.
+        self._on_link_lost()
 
     def on_connect(self, client, userdata, flags, reason_code, properties=None):
         # Handle both int reason codes and richer reason objects
@@ -244,8 +541,19 @@ class Rover:
         if failed:
             print(f"Failed to connect to cloud broker: {reason_code}")
         else:
-            print("Successfully connected to HiveMQ Cloud Broker!")
-            client.subscribe(MQTT_TOPIC_COMMAND)
+            session_present = bool(flags.get("session present")) if isinstance(flags, dict) else False
+            if self._outage_start is not None:
+                # Time-to-first-command is measured from the same outage start
+                self.link_metrics["reconnect_s"] = round(time.monotonic() - self._outage_start, 3)
+                self._awaiting_first_command = True
+            self._mqtt_attempt = 0
+            self.link_metrics["connects"] += 1
+            self.mqtt_connected.set()
+            print(f"Successfully connected to HiveMQ Cloud Broker! (session present: {session_present}, "
+                  f"took {self.link_metrics['reconnect_s']}s)")
+            # QoS 1 on a persistent session: the broker queues commands sent
+            # while the link is down and delivers them on reconnect.
+            client.subscribe(MQTT_TOPIC_COMMAND, qos=1)
             # Publish a retained ON state so backend sees rover online (overwrites LWT)
             try:
                 with self.state_lock:
@@ -258,14 +566,23 @@ class Rover:
         try:
             payload = json.loads(msg.payload.decode())
             command = payload.get("command")
-            # allow remote power control now that there's no hardware button
+            if command == "clock_sync":
+                self.mailbox.clock_sync(payload, time.monotonic())
+                return
+            if self._awaiting_first_command:
+                self._awaiting_first_command = False
+                self.link_metrics["first_command_s"] = round(time.monotonic() - self._outage_start, 3)
+            # Drop re-delivered/out-of-order and expired commands
+            deadline = self.mailbox.admit(command, payload, time.monotonic())
+            if deadline is None:
+                return
+            # allow remote power control now that there's no hardware button;
+            # both return as soon as the state has changed
             if command == "power_on":
-                with self.state_lock:
-                    self.power_on()
+                self.power_on()
                 return
             if command == "power_off":
-                with self.state_lock:
-                    self.power_off()
+                self.power_off()
                 return
 
             if command == "mode_change":
@@ -273,9 +590,9 @@ class Rover:
                 new_mode = str(payload.get("mode", "manual")).lower()
                 with self.state_lock:
                     self.mode = new_mode
-                    print(f"Mode changed to: {self.mode}")
-                    self.update_leds()
-                    self.stop()
+                print(f"Mode changed to: {new_mode}")
+                self.update_leds()
+                self.stop()
                 return
 
             # movement commands only apply when powered on
@@ -284,18 +601,44 @@ class Rover:
             if not powered:
                 return
 
-            # store last_command (no complex parsing here)
+            # hand the command to the control loop (autonomous ignores them)
             with self.state_lock:
-                    if self.mode in ["manual", "assisted"]:
-                        self.last_command = command
-                        # If in manual mode, start a timer so movement only lasts
-                        # for COMMAND_DURATION seconds. Assisted/autonomous keep
-                        # their existing behavior.
-                        if self.mode == "manual":
-                            self.command_timer = (command, time.time())
+                mode = self.mode
+            if mode in ["manual", "assisted"] and command in MOVE_COMMANDS:
+                self.mailbox.post(command, payload.get("seq"), deadline)
+                if command == "stop":
+                    # stop pre-empts: cut the motors now instead of waiting for
+                    # the next loop tick
+                    self.stop()
         except Exception as e:
             print(f"Error processing MQTT message: {e}")
 
+    def telemetry_delta(self, telemetry, now):
+        """Fields of `telemetry` worth publishing: changes past their deadband, or everything on a heartbeat."""
+        if self._force_full:
+            self._force_full = False
+            self._last_sent = None
+        if self._last_sent is None or now - self._last_heartbeat >= TELEMETRY_HEARTBEAT_S:
+            self._last_sent = dict(telemetry)
+            self._last_heartbeat = now
+            return dict(telemetry, full=True)
+        delta = {}
+        for key, value in telemetry.items():
+            if key in HEARTBEAT_ONLY_FIELDS:
+                continue
+            prev = self._last_sent.get(key)
+            band = TELEMETRY_DEADBANDS.get(key)
+            if band is not None and value is not None and prev is not None:
+                # compare with the last *sent* value so slow drift still
+                # gets published once it accumulates past the band
+                if abs(value - prev) < band:
+                    continue
+            elif value == prev:
+                continue
+            delta[key] = value
+            self._last_sent[key] = value
+        return delta
+
     def update_leds(self):
         GPIO.output(MODE_LEDS, GPIO.LOW)
         if self.power_state == "ON":
@@ -304,45 +647,85 @@ class Rover:
             elif self.mode == "assisted": GPIO.output(LED_ASSISTED, GPIO.HIGH)
             elif self.mode == "autonomous": GPIO.output(LED_AUTONOMOUS, GPIO.HIGH)
 
-    def power_on(self):
-        if self.power_state == "ON": return
-        print("Powering ON rover systems...")
-        self.power_state = "ON"
-        self.pwm_left.start(0); self.pwm_right.start(0)
-        try:
-            # ensure MQTT connected
+    def _background(self, fn, *args):
+        """Run fn(*args) on the rover's task thread, in submission order."""
+        if self._task_thread is None or not self._task_thread.is_alive():
+            self._task_thread = threading.Thread(target=self._task_worker, daemon=True)
+            self._task_thread.start()
+        self._tasks.put((fn, args))
+
+    def _task_worker(self):
+        while True:
+            fn, args = self._tasks.get()
             try:
-                self._reconnect_stop.clear()
-                self.mqtt_client.connect(MQTT_BROKER_HOSTNAME, MQTT_BROKER_PORT, 60)
-                self.mqtt_client.loop_start()
+                fn(*args)
             except Exception as e:
-                print(f"Failed to connect on power on: {e}")
-            self.mode = "manual"; self.update_leds()
-            # publish an initial telemetry message to indicate power state (retained)
+                print(f"Background task failed: {e}")
+
+    def drain_background(self, timeout=1.0):
+        """Wait for queued background tasks, then for the last announcement to reach the broker."""
+        done = threading.Event()
+        self._background(done.set)
+        done.wait(timeout)
+        info = self._last_announce
+        if info is not None and self.mqtt_connected.is_set():
             try:
-                telemetry = {"power": True, "power_state": "ON", "mode": self.mode}
-                telemetry.update(self.read_sensors())
-                self.mqtt_client.publish(MQTT_TOPIC_TELEMETRY, json.dumps(telemetry), qos=1, retain=True)
-            except Exception as e:
-                print(f"Failed to publish initial telemetry: {e}")
-        except Exception as e:
-            print(f"Power on failure: {e}")
-            self.power_state = "OFF"
+                info.wait_for_publish(timeout)
+            except Exception:
+                pass
 
-    def power_off(self):
-        if self.power_state == "OFF": return
-        print("Powering OFF rover systems...")
-        self.power_state = "OFF"; self.stop(); self.pwm_left.stop(); self.pwm_right.stop()
+    def _announce_power(self, power_state, changed_at):
+        # Retained so the dashboard sees the power state on (re)connect. The
+        # sensor values follow with the control loop's next full sample.
+        with self.state_lock:
+            state = {"power": power_state == "ON", "power_state": power_state, "mode": self.mode}
         try:
-            # publish a final OFF state (boolean) so the server/front-end knows rover is offline (retained)
-            self.mqtt_client.publish(MQTT_TOPIC_TELEMETRY, json.dumps({"power": False, "power_state": "OFF", "mode": self.mode}), qos=1, retain=True)
-            time.sleep(0.1)
+            self._last_announce = self.mqtt_client.publish(MQTT_TOPIC_TELEMETRY, json.dumps(state), qos=1, retain=True)
         except Exception as e:
-            print(f"Could not publish final OFF state: {e}")
+            print(f"Failed to publish {power_state} state: {e}")
+        self.transition_metrics["announce_ms"] = round((time.perf_counter() - changed_at) * 1000.0, 3)
+
+    def power_on(self):
+        """Switch ON. Returns once the state has changed; the announcement is published in the background."""
+        started = time.perf_counter()
+        with self._power_lock:
+            with self.state_lock:
+                if self.power_state == "ON": return
+                self.power_state = "ON"
+                self.mode = "manual"
+                self._force_full = True  # first sample after power-up is sent in full
+            print("Powering ON rover systems...")
+            try:
+                self.pwm_left.start(0); self.pwm_right.start(0)
+                self.update_leds()
+            except Exception as e:
+                print(f"Power on failure: {e}")
+                with self.state_lock:
+                    self.power_state = "OFF"
+                return
+            changed_at = time.perf_counter()
+            self.transition_metrics["power_on_ms"] = round((changed_at - started) * 1000.0, 3)
+        # ensure the connection manager is running (no-op if it already is)
+        if self.connect_mqtt:
+            self.start_mqtt()
+        self._background(self._announce_power, "ON", changed_at)
+
+    def power_off(self):
+        """Switch OFF. Motors stop immediately; the final OFF state is published in the background."""
+        started = time.perf_counter()
+        with self._power_lock:
+            with self.state_lock:
+                if self.power_state == "OFF": return
+                self.power_state = "OFF"
+            print("Powering OFF rover systems...")
+            self.stop(); self.pwm_left.stop(); self.pwm_right.stop()
+            GPIO.output(MODE_LEDS, GPIO.LOW)
+            changed_at = time.perf_counter()
+            self.transition_metrics["power_off_ms"] = round((changed_at - started) * 1000.0, 3)
         # Important: keep the MQTT client running and subscribed so the
         # dashboard can send `power_on` commands. Do not call loop_stop() or
         # disconnect() here.
-        GPIO.output(MODE_LEDS, GPIO.LOW)
+        self._background(self._announce_power, "OFF", changed_at)
 
     # no button callback — power is controlled via code or MQTT commands
 
@@ -373,23 +756,23 @@ class Rover:
         # Robust HC-SR04 read with timeouts; returns distance in cm or None on timeout/error
         try:
             GPIO.output(TRIG, False)
-            time.sleep(0.00005)
+            self.clock.sleep(0.00005)
             GPIO.output(TRIG, True)
-            time.sleep(0.00001)
+            self.clock.sleep(0.00001)
             GPIO.output(TRIG, False)
 
-            start = time.time()
+            start = self.clock.time()
             timeout = start + 0.05  # 50 ms to wait for echo start
-            while GPIO.input(ECHO) == 0 and time.time() < timeout:
+            while GPIO.input(ECHO) == 0 and self.clock.time() < timeout:
                 pass
-            if time.time() >= timeout:
+            if self.clock.time() >= timeout:
                 return None
-            pulse_start = time.time()
+            pulse_start = self.clock.time()
 
             timeout = pulse_start + 0.05  # 50 ms max pulse width
-            while GPIO.input(ECHO) == 1 and time.time() < timeout:
+            while GPIO.input(ECHO) == 1 and self.clock.time() < timeout:
                 pass
-            pulse_end = time.time()
+            pulse_end = self.clock.time()
 
             if pulse_end <= pulse_start:
                 return None
@@ -427,73 +810,102 @@ class Rover:
         result["forward_distance_cm"] = distance if distance is not None else None
         return result
             
-    def run(self):
+    def decide(self, mode, command, distance_val):
+        """Plan this tick's motion as a list of (wheels, hold_s) steps; wheels None means stop."""
+        if mode == "manual":
+            # Manual movement only lasts COMMAND_DURATION seconds before
+            # auto-stopping.
+            if self.command_started is not None and self.clock.time() - self.command_started >= COMMAND_DURATION:
+                self.last_command = "stop"
+                self.command_started = None
+                command = "stop"
+            return [(DRIVE_SPEEDS.get(command), 0)]
+        if mode == "assisted":
+            if distance_val is not None and distance_val <= SAFE_DISTANCE_CM and command == "forward":
+                return [(None, 0)]
+            return [(DRIVE_SPEEDS.get(command), 0)]
+        if mode == "autonomous":
+            if distance_val is None or distance_val > SAFE_DISTANCE_CM:
+                return [((70, 70), 0)]
+            # back off, then turn away
+            return [((-70, -70), 0.5), ((70, -70), 0.7)]
+        return []
+
+    def actuate(self, plan, prof=None):
+        for wheels, hold in plan:
+            if wheels is None:
+                self.stop()
+            else:
+                self.move(*wheels)
+            if hold:
+                if prof: prof.mark("actuate")
+                self.clock.sleep(hold)
+                # the hold is deliberate, not actuation cost
+                if prof: prof.start()
+
+    def run(self, max_ticks=None):
+        """Main control loop; `max_ticks` bounds the iterations (used by simulations)."""
         print("Rover initialized.")
+        ticks = 0
+        prof = self.profiler
         try:
-            while True:
+            while max_ticks is None or ticks < max_ticks:
+                ticks += 1
                 with self.state_lock:
                     powered = (self.power_state == "ON")
                 if powered:
+                    if prof: prof.start()
                     telemetry = self.read_sensors()
+                    if prof: prof.mark("sense")
                     # include standardized mode and boolean power
                     with self.state_lock:
                         telemetry['mode'] = self.mode
                         telemetry['power'] = True
                         telemetry['power_state'] = self.power_state
-                    # publish telemetry (allow None values)
-                    try:
-                        self.mqtt_client.publish(MQTT_TOPIC_TELEMETRY, json.dumps(telemetry))
-                    except Exception as e:
-                        print(f"Telemetry publish failed: {e}")
+                    telemetry['link'] = self.link_metrics
+                    telemetry['commands'] = self.mailbox.counters
+                    telemetry['tx'] = self.tx_counts
+                    telemetry['transitions'] = self.transition_metrics
+                    if prof: telemetry['profile'] = prof.summary()
+                    # publish only what changed (allow None values); the server
+                    # merges partial updates into its full state
+                    self.tx_counts["samples"] += 1
+                    update = self.telemetry_delta(telemetry, self.clock.time())
+                    if update:
+                        self.tx_counts["published"] += 1
+                        try:
+                            self.mqtt_client.publish(MQTT_TOPIC_TELEMETRY, json.dumps(update))
+                        except Exception as e:
+                            print(f"Telemetry publish failed: {e}")
+                    if prof: prof.mark("publish")
 
                     # movement logic uses lowercase mode names
                     distance_val = telemetry.get('forward_distance_cm') if telemetry.get('forward_distance_cm') is not None else telemetry.get('distance', 999)
 
                     with self.state_lock:
                         current_mode = self.mode
-                        current_command = self.last_command
-
-                    if current_mode == "manual":
-                        # If a manual command has a timer, ensure it only runs for
-                        # COMMAND_DURATION seconds before auto-stopping.
-                        run_command = current_command
-                        if self.command_timer and self.command_timer[0] == current_command:
-                            elapsed = time.time() - self.command_timer[1]
-                            if elapsed >= COMMAND_DURATION:
-                                run_command = "stop"
-                                # clear timer and last_command
-                                with self.state_lock:
-                                    self.last_command = "stop"
-                                    self.command_timer = None
-
-                        if run_command == "forward":
-                            self.move(80, 80)
-                        elif run_command == "backward":
-                            self.move(-80, -80)
-                        elif run_command == "left":
-                            self.move(-70, 70)
-                        elif run_command == "right":
-                            self.move(70, -70)
-                        else:
-                            self.stop()
-                    elif current_mode == "assisted":
-                        if distance_val is not None and distance_val <= SAFE_DISTANCE_CM and current_command == "forward":
-                            self.stop()
-                        else:
-                            if current_command == "forward": self.move(80, 80)
-                            elif current_command == "backward": self.move(-80, -80)
-                            elif current_command == "left": self.move(-70, 70)
-                            elif current_command == "right": self.move(70, -70)
-                            else: self.stop()
-                    elif current_mode == "autonomous":
-                        if distance_val is None or distance_val > SAFE_DISTANCE_CM: self.move(70, 70)
-                        else: self.move(-70, -70); time.sleep(0.5); self.move(70, -70); time.sleep(0.7)
-                time.sleep(0.1)
+
+                    # lock-free: pick up the newest command, if any
+                    new_command = self.mailbox.take(time.monotonic())
+                    if new_command is not None:
+                        self.last_command = new_command
+                        self.command_started = self.clock.time()
+                    plan = self.decide(current_mode, self.last_command, distance_val)
+                    if prof: prof.mark("decide")
+                    self.actuate(plan, prof)
+                    if prof:
+                        prof.mark("actuate")
+                        prof.end_tick()
+                self.clock.sleep(0.1)
         except KeyboardInterrupt:
             print("Program exiting.")
         finally:
             self.power_off()
+            # let the final OFF state reach the broker before exiting
+            self.drain_background()
             GPIO.cleanup()
+            if prof and prof.path:
+                prof.dump()
 
 if __name__ == "__main__":
     rover = Rover()
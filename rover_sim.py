@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+# rover_sim.py
+# Deterministic simulated world for the mocked hardware path of rover.py.
+#
+# When the Raspberry Pi libraries are missing, rover.py falls back to dummy
+# GPIO/PWM/DHT/ADC classes. Installing a SimHardware instance makes those
+# mocks drive a differential-drive robot inside an obstacle map, answer the
+# HC-SR04 echo pin with ray-cast distances and report synthetic environmental
+# fields, all on a virtual clock so `Rover.run` executes far faster than
+# wall-clock time.
+#
+# Usage:
+#   python rover_sim.py --ticks 20000 --mode assisted [--fail-on-collision]
+
+import argparse
+import math
+import random
+import time
+
+SPEED_OF_SOUND_CM_S = 34300.0
+ECHO_LATENCY_S = 0.0002        # HC-SR04 delay between trigger and echo start
+SONAR_MAX_RANGE_CM = 400.0
+# HC-SR04 beam is roughly a 15 degree cone; sample it with a few rays
+SONAR_RAY_OFFSETS = (0.0, math.radians(-7.5), math.radians(7.5))
+# A contact starts within CONTACT_TOLERANCE_CM of a surface and only ends once
+# the robot is CONTACT_RELEASE_CM away, so scraping along a wall is one event.
+CONTACT_TOLERANCE_CM = 0.05
+CONTACT_RELEASE_CM = 1.0
+
+
+class VirtualClock:
+    """Drop-in for the `time` module functions the rover uses (`time()`, `sleep()`).
+
+    Time only moves when something sleeps or advances it; every advance is
+    forwarded to `on_advance(dt)` so the world can integrate physics.
+    """
+
+    def __init__(self, start=0.0, on_advance=None):
+        self.now = float(start)
+        self.on_advance = on_advance
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        if seconds <= 0:
+            return
+        self.now += seconds
+        if self.on_advance:
+            self.on_advance(seconds)
+
+    def advance_to(self, t):
+        self.advance(t - self.now)
+
+
+class CircleObstacle:
+    def __init__(self, x, y, r):
+        self.x, self.y, self.r = x, y, r
+
+    def clearance(self, x, y):
+        """Signed distance from (x, y) to the obstacle surface (negative inside)."""
+        return math.hypot(x - self.x, y - self.y) - self.r
+
+    def normal(self, x, y):
+        """Outward unit normal of the surface nearest to (x, y)."""
+        dx, dy = x - self.x, y - self.y
+        d = math.hypot(dx, dy) or 1.0
+        return dx / d, dy / d
+
+    def ray(self, ox, oy, dx, dy):
+        # Solve |o + t*d - c|^2 = r^2 for the nearest t >= 0
+        fx, fy = ox - self.x, oy - self.y
+        b = fx * dx + fy * dy
+        c = fx * fx + fy * fy - self.r * self.r
+        disc = b * b - c
+        if disc < 0:
+            return None
+        root = math.sqrt(disc)
+        for t in (-b - root, -b + root):
+            if t >= 0:
+                return t
+        return None
+
+
+class BoxObstacle:
+    """Axis-aligned rectangle (x0, y0)-(x1, y1)."""
+
+    def __init__(self, x0, y0, x1, y1):
+        self.x0, self.x1 = min(x0, x1), max(x0, x1)
+        self.y0, self.y1 = min(y0, y1), max(y0, y1)
+
+    def clearance(self, x, y):
+        """Signed distance from (x, y) to the box surface (negative inside)."""
+        dx = max(self.x0 - x, 0.0, x - self.x1)
+        dy = max(self.y0 - y, 0.0, y - self.y1)
+        if dx or dy:
+            return math.hypot(dx, dy)
+        return -min(x - self.x0, self.x1 - x, y - self.y0, self.y1 - y)
+
+    def normal(self, x, y):
+        """Outward unit normal of the surface nearest to (x, y)."""
+        dx = (x - self.x1) if x > self.x1 else (x - self.x0) if x < self.x0 else 0.0
+        dy = (y - self.y1) if y > self.y1 else (y - self.y0) if y < self.y0 else 0.0
+        if dx or dy:
+            d = math.hypot(dx, dy)
+            return dx / d, dy / d
+        # Inside: push out through the nearest face
+        faces = [(x - self.x0, (-1.0, 0.0)), (self.x1 - x, (1.0, 0.0)), (y - self.y0, (0.0, -1.0)), (self.y1 - y, (0.0, 1.0))]
+        return min(faces)[1]
+
+    def ray(self, ox, oy, dx, dy):
+        # Slab method
+        if dx:
+            t1, t2 = (self.x0 - ox) / dx, (self.x1 - ox) / dx
+            tmin, tmax = (t1, t2) if t1 < t2 else (t2, t1)
+        elif self.x0 <= ox <= self.x1:
+            tmin, tmax = -math.inf, math.inf
+        else:
+            return None
+        if dy:
+            t1, t2 = (self.y0 - oy) / dy, (self.y1 - oy) / dy
+            if t1 > t2:
+                t1, t2 = t2, t1
+            if t1 > tmin:
+                tmin = t1
+            if t2 < tmax:
+                tmax = t2
+        elif not (self.y0 <= oy <= self.y1):
+            return None
+        if tmin > tmax or tmax < 0:
+            return None
+        return tmin if tmin >= 0 else 0.0
+
+
+def walled_arena(width, height, thickness=10.0):
+    """Four boxes enclosing a width x height (cm) arena with its corner at the origin."""
+    return [
+        BoxObstacle(-thickness, -thickness, width + thickness, 0),
+        BoxObstacle(-thickness, height, width + thickness, height + thickness),
+        BoxObstacle(-thickness, 0, 0, height),
+        BoxObstacle(width, 0, width + thickness, height),
+    ]
+
+
+def default_obstacles(width=400.0, height=300.0, seed=0, count=6):
+    rng = random.Random(seed)
+    obstacles = walled_arena(width, height)
+    for _ in range(count):
+        obstacles.append(CircleObstacle(rng.uniform(60, width - 60), rng.uniform(60, height - 60), rng.uniform(8, 20)))
+    return obstacles
+
+
+class EnvironmentField:
+    """Smooth synthetic temperature / humidity / air-quality fields with seeded noise."""
+
+    def __init__(self, seed=0, base_temp=22.0, base_humidity=45.0, base_air=4500.0, plumes=None):
+        self.rng = random.Random(seed)
+        self.base_temp = base_temp
+        self.base_humidity = base_humidity
+        self.base_air = base_air
+        # (x, y, radius_cm, peak) gaussian air-quality plumes
+        self.plumes = plumes if plumes is not None else [(300.0, 220.0, 60.0, 12000.0)]
+
+    def temperature_c(self, x, y, t):
+        return round(self.base_temp + 0.005 * x + 1.5 * math.sin(t / 600.0) + self.rng.gauss(0, 0.05), 1)
+
+    def humidity_percent(self, x, y, t):
+        return round(self.base_humidity - 0.01 * y + 3.0 * math.cos(t / 900.0) + self.rng.gauss(0, 0.1), 1)
+
+    def air_quality_raw(self, x, y, t):
+        value = self.base_air
+        for px, py, radius, peak in self.plumes:
+            d2 = (x - px) ** 2 + (y - py) ** 2
+            value += peak * math.exp(-d2 / (2 * radius * radius))
+        return int(value + self.rng.gauss(0, 30))
+
+
+class SimWorld:
+    """Differential-drive robot in a 2D obstacle map (units: cm, seconds, radians)."""
+
+    def __init__(self, obstacles=None, field=None, start=(50.0, 150.0, 0.0),
+                 track_width_cm=15.0, max_wheel_speed_cm_s=50.0, robot_radius_cm=8.0,
+                 max_step_s=0.05):
+        self.obstacles = obstacles if obstacles is not None else default_obstacles()
+        self.field = field if field is not None else EnvironmentField()
+        self.x, self.y, self.heading = start
+        self.track_width = track_width_cm
+        self.max_wheel_speed = max_wheel_speed_cm_s
+        self.radius = robot_radius_cm
+        self.max_step = max_step_s
+        self.left_duty = 0.0     # signed duty cycle, -100..100
+        self.right_duty = 0.0
+        # Physics is integrated lazily: clock advances accumulate here and are
+        # applied when the robot state is observed or the wheel duties change,
+        # so the microsecond sleeps of a sonar read cost nothing.
+        self._pending = 0.0
+        self._clearance = None   # clearance at the current position (cached between steps)
+        self.clock = VirtualClock(on_advance=self._defer)
+        # Run statistics
+        self.odometer_cm = 0.0
+        self.collisions = 0
+        self.in_collision = False
+
+    def _defer(self, dt):
+        self._pending += dt
+
+    def sync(self):
+        """Integrate any clock time that has passed since the last observation."""
+        if self._pending > 0.0:
+            dt, self._pending = self._pending, 0.0
+            self.step(dt)
+
+    def set_wheels(self, left_duty, right_duty):
+        left = max(-100.0, min(100.0, left_duty))
+        right = max(-100.0, min(100.0, right_duty))
+        if left == self.left_duty and right == self.right_duty:
+            return
+        self.sync()
+        self.left_duty, self.right_duty = left, right
+
+    def clearance(self, x, y):
+        return min(o.clearance(x, y) for o in self.obstacles)
+
+    def nearest(self, x, y):
+        """(clearance, obstacle) for the obstacle closest to (x, y)."""
+        return min(((o.clearance(x, y), o) for o in self.obstacles), key=lambda item: item[0])
+
+    def _arc(self, v, omega, h):
+        """Exact constant-velocity unicycle motion over h seconds."""
+        if abs(omega) < 1e-9:
+            self.x += v * h * math.cos(self.heading)
+            self.y += v * h * math.sin(self.heading)
+        else:
+            heading = self.heading + omega * h
+            self.x += v / omega * (math.sin(heading) - math.sin(self.heading))
+            self.y -= v / omega * (math.cos(heading) - math.cos(self.heading))
+            self.heading = math.atan2(math.sin(heading), math.cos(heading))
+        self.odometer_cm += abs(v) * h
+
+    def step(self, dt):
+        vl = self.left_duty / 100.0 * self.max_wheel_speed
+        vr = self.right_duty / 100.0 * self.max_wheel_speed
+        v = (vl + vr) / 2.0
+        omega = (vr - vl) / self.track_width
+        if v == 0.0:
+            # Stationary or turning in place: no translation, nothing to collide with
+            heading = self.heading + omega * dt
+            self.heading = math.atan2(math.sin(heading), math.cos(heading))
+            return
+        clearance = self._clearance if self._clearance is not None else self.clearance(self.x, self.y)
+        while dt > 1e-12:
+            free = clearance - self.radius
+            if free > self.max_step * abs(v):
+                # Conservative advancement: the path length over h cannot reach
+                # any obstacle, so integrate the whole arc in one go.
+                h = min(dt, free / abs(v))
+                dt -= h
+                self._arc(v, omega, h)
+                clearance = self.clearance(self.x, self.y)
+                continue
+            h = min(dt, self.max_step)
+            dt -= h
+            heading = self.heading + omega * h
+            self.heading = math.atan2(math.sin(heading), math.cos(heading))
+            dx = v * h * math.cos(heading)
+            dy = v * h * math.sin(heading)
+            # Near an obstacle: take the full move if it does not push further
+            # in, otherwise slide along the surface (drop the inward component).
+            new_clearance = self.clearance(self.x + dx, self.y + dy)
+            if new_clearance < self.radius and new_clearance < clearance and free > CONTACT_TOLERANCE_CM:
+                # Close the remaining gap exactly (a move no longer than the
+                # clearance cannot penetrate anything)
+                scale = free / math.hypot(dx, dy)
+                dx, dy = dx * scale, dy * scale
+                new_clearance = self.clearance(self.x + dx, self.y + dy)
+            if new_clearance < self.radius and new_clearance < clearance:
+                nx, ny = self.nearest(self.x, self.y)[1].normal(self.x, self.y)
+                inward = dx * nx + dy * ny
+                if inward < 0:
+                    dx -= inward * nx
+                    dy -= inward * ny
+                new_clearance = self.clearance(self.x + dx, self.y + dy)
+                if math.hypot(dx, dy) < 1e-9 or (new_clearance < self.radius and new_clearance < clearance):
+                    # Wedged (e.g. head-on or in a corner): without turning,
+                    # the rest of the interval would be identical.
+                    if not self.in_collision:
+                        self.collisions += 1
+                    self.in_collision = True
+                    if omega == 0.0:
+                        break
+                    continue
+            self.x += dx
+            self.y += dy
+            self.odometer_cm += math.hypot(dx, dy)
+            clearance = new_clearance
+            if clearance < self.radius + CONTACT_TOLERANCE_CM:
+                if not self.in_collision:
+                    self.collisions += 1
+                self.in_collision = True
+            elif clearance > self.radius + CONTACT_RELEASE_CM:
+                self.in_collision = False
+        if self.in_collision and clearance > self.radius + CONTACT_RELEASE_CM:
+            self.in_collision = False
+        self._clearance = clearance
+
+    def distance_cm(self):
+        """Nearest echo across the sonar beam cone, measured from the front of the robot; None if out of range."""
+        self.sync()
+        best = None
+        for offset in SONAR_RAY_OFFSETS:
+            heading = self.heading + offset
+            dx, dy = math.cos(heading), math.sin(heading)
+            ox = self.x + math.cos(self.heading) * self.radius
+            oy = self.y + math.sin(self.heading) * self.radius
+            for o in self.obstacles:
+                t = o.ray(ox, oy, dx, dy)
+                if t is not None and (best is None or t < best):
+                    best = t
+        if best is None or best > SONAR_MAX_RANGE_CM:
+            return None
+        return best
+
+    def temperature_c(self):
+        self.sync()
+        return self.field.temperature_c(self.x, self.y, self.clock.now)
+
+    def humidity_percent(self):
+        self.sync()
+        return self.field.humidity_percent(self.x, self.y, self.clock.now)
+
+    def air_quality_raw(self):
+        self.sync()
+        return self.field.air_quality_raw(self.x, self.y, self.clock.now)
+
+
+class SimHardware:
+    """Pin-level adapter between rover.py's mock GPIO/PWM classes and a SimWorld.
+
+    `pins` maps the rover's pin names (ENA, IN1, IN2, ENB, IN3, IN4, TRIG, ECHO)
+    to BCM numbers; `swap_motors` / `left_motor_invert` mirror the rover's wiring
+    flags so logical left/right speeds end up on the matching simulated wheels.
+    """
+
+    def __init__(self, world, pins, swap_motors=False, left_motor_invert=False):
+        self.world = world
+        self.clock = world.clock
+        self.pins = pins
+        self.swap_motors = swap_motors
+        self.left_motor_invert = left_motor_invert
+        self.levels = {}
+        self.duty = {}
+        self._motor_pins = {pins[name] for name in ('ENA', 'IN1', 'IN2', 'ENB', 'IN3', 'IN4')}
+        self._echo = None        # (start, end) of the pending echo pulse
+
+    # --- GPIO ---
+    def output(self, pins, value):
+        motors_changed = False
+        for pin in (pins if isinstance(pins, (list, tuple)) else [pins]):
+            previous = self.levels.get(pin, 0)
+            self.levels[pin] = 1 if value else 0
+            if pin == self.pins['TRIG'] and previous and not value:
+                self._trigger()
+            elif pin in self._motor_pins:
+                motors_changed = True
+        if motors_changed:
+            self._update_wheels()
+
+    def input(self, pin):
+        if pin != self.pins['ECHO']:
+            return self.levels.get(pin, 0)
+        # Polling loops spin on the echo pin; jump the clock to the next edge so
+        # a virtual-time busy wait terminates immediately.
+        now = self.clock.time()
+        if self._echo is None:
+            self.clock.advance(0.001)
+            return 0
+        start, end = self._echo
+        if now < start:
+            self.clock.advance_to(start)
+            return 1
+        if now < end:
+            self.clock.advance_to(end)
+            self._echo = None
+            return 0
+        self._echo = None
+        return 0
+
+    def _trigger(self):
+        distance = self.world.distance_cm()
+        if distance is None:
+            self._echo = None
+            return
+        start = self.clock.time() + ECHO_LATENCY_S
+        self._echo = (start, start + 2.0 * distance / SPEED_OF_SOUND_CM_S)
+
+    # --- PWM ---
+    def set_duty(self, pin, duty):
+        self.duty[pin] = float(duty)
+        self._update_wheels()
+
+    def _channel(self, enable, forward_pin, reverse_pin):
+        duty = self.duty.get(self.pins[enable], 0.0)
+        if self.levels.get(self.pins[forward_pin]) and not self.levels.get(self.pins[reverse_pin]):
+            return duty
+        if self.levels.get(self.pins[reverse_pin]) and not self.levels.get(self.pins[forward_pin]):
+            return -duty
+        return 0.0
+
+    def _update_wheels(self):
+        a = self._channel('ENA', 'IN1', 'IN2')
+        b = self._channel('ENB', 'IN3', 'IN4')
+        if self.left_motor_invert:
+            a = -a
+        left, right = (b, a) if self.swap_motors else (a, b)
+        self.world.set_wheels(left, right)
+
+    # --- Sensors ---
+    def temperature(self):
+        return self.world.temperature_c()
+
+    def humidity(self):
+        return self.world.humidity_percent()
+
+    def analog_value(self):
+        return self.world.air_quality_raw()
+
+
+def run_simulation(ticks=10000, mode='assisted', command='forward', seed=0, world=None):
+    """Run `Rover.run` for `ticks` loop iterations inside a SimWorld and return run statistics."""
+    import rover as rover_mod
+
+    world = world or SimWorld(obstacles=default_obstacles(seed=seed), field=EnvironmentField(seed=seed))
+    hardware = SimHardware(
+        world,
+        pins={name: getattr(rover_mod, name) for name in ('ENA', 'IN1', 'IN2', 'ENB', 'IN3', 'IN4', 'TRIG', 'ECHO')},
+        swap_motors=rover_mod.SWAP_MOTORS,
+        left_motor_invert=rover_mod.LEFT_MOTOR_INVERT,
+    )
+    rover_mod.install_sim(hardware)
+    rover = rover_mod.Rover(clock=world.clock, connect_mqtt=False)
+    distances = []
+    original_get_distance = rover.get_distance
+
+    def recording_get_distance():
+        d = original_get_distance()
+        if d is not None:
+            distances.append(d)
+        return d
+
+    rover.get_distance = recording_get_distance
+    rover.power_on()
+    rover.mode = mode
+    rover.last_command = command
+    wall_start = time.perf_counter()
+    sim_start = world.clock.time()
+    rover.run(max_ticks=ticks)
+    wall = time.perf_counter() - wall_start
+    simulated = world.clock.time() - sim_start
+    world.sync()
+    return {
+        'ticks': ticks,
+        'mode': mode,
+        'simulated_s': simulated,
+        'wall_s': wall,
+        'speedup': simulated / wall if wall > 0 else math.inf,
+        'ticks_per_s': ticks / wall if wall > 0 else math.inf,
+        'odometer_cm': world.odometer_cm,
+        'collisions': world.collisions,
+        'min_distance_cm': min(distances) if distances else None,
+        'pose': (round(world.x, 1), round(world.y, 1), round(world.heading, 3)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the rover control loop in a simulated world')
+    parser.add_argument('--ticks', type=int, default=10000, help='control loop iterations (default: 10000)')
+    parser.add_argument('--mode', default='assisted', choices=['manual', 'assisted', 'autonomous'],
+                        help='control mode (default: assisted, the collision-free CI gate)')
+    parser.add_argument('--command', default='forward', help='initial movement command for manual/assisted')
+    parser.add_argument('--seed', type=int, default=0, help='obstacle map / noise seed')
+    parser.add_argument('--fail-on-collision', action='store_true', help='exit non-zero if the rover hit anything')
+    args = parser.parse_args()
+
+    stats = run_simulation(ticks=args.ticks, mode=args.mode, command=args.command, seed=args.seed)
+    for key, value in stats.items():
+        print(f"{key:>16}: {value:.3f}" if isinstance(value, float) else f"{key:>16}: {value}")
+    if args.fail_on_collision and stats['collisions']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+compress_static.py
+
+Build-time precompression of the dashboard's static assets.
+- Writes `<file>.gz` (and `<file>.br` when the optional `brotli` package is
+  installed) next to every compressible file under static/.
+- app.py serves these variants by Accept-Encoding negotiation, so no CPU is
+  spent compressing assets per request.
+- A variant is kept only if it is smaller than the original. It gets the
+  source's mtime so the server can detect and ignore stale variants after an
+  asset is edited without re-running this script.
+
+Usage:
+  python scripts/compress_static.py [--static static] [--clean]
+"""
+
+import os
+import gzip
+import argparse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Images such as PNG are already compressed; only text assets benefit
+COMPRESSIBLE = ('.js', '.css', '.html', '.svg', '.json', '.txt', '.map')
+VARIANT_SUFFIXES = ('.gz', '.br')
+
+
+def compress_gzip(data):
+    # mtime=0 keeps the output byte-for-byte reproducible between builds
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def compress_brotli(data):
+    return brotli.compress(data, quality=11)
+
+
+def build(static_dir):
+    encoders = [('.gz', compress_gzip)]
+    if brotli is not None:
+        encoders.append(('.br', compress_brotli))
+    else:
+        print("brotli not installed; writing gzip variants only (pip install brotli)")
+    written = 0
+    for root, _, files in os.walk(static_dir):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            source = os.path.join(root, name)
+            with open(source, 'rb') as f:
+                data = f.read()
+            st = os.stat(source)
+            for suffix, encode in encoders:
+                variant = source + suffix
+                packed = encode(data)
+                if len(packed) >= len(data):
+                    if os.path.exists(variant):
+                        os.remove(variant)
+                    continue
+                with open(variant, 'wb') as f:
+                    f.write(packed)
+                os.utime(variant, ns=(st.st_atime_ns, st.st_mtime_ns))
+                written += 1
+                print(f"{variant}: {len(data)} -> {len(packed)} bytes ({100.0 * len(packed) / len(data):.0f}%)")
+    return written
+
+
+def clean(static_dir):
+    removed = 0
+    for root, _, files in os.walk(static_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            # only variants of an existing source file
+            if name.endswith(VARIANT_SUFFIXES) and os.path.isfile(path[:-3]):
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompress static assets (gzip/brotli)')
+    parser.add_argument('--static', default=os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'static')),
+                        help='static directory (default: ../static)')
+    parser.add_argument('--clean', action='store_true', help='remove precompressed variants instead of building them')
+    args = parser.parse_args()
+    if args.clean:
+        print(f"Removed {clean(args.static)} precompressed files")
+    else:
+        print(f"Wrote {build(args.static)} precompressed files")
+
+
+if __name__ == '__main__':
+    main()
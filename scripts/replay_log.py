@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+replay_log.py
+
+Replay a recorded Odyssey log (data/odyssey_log.csv or any archived segment of it)
+onto the telemetry topic, for load and regression testing against real data.
+- Preserves the recorded timing at --speed 1, compresses it at --speed 10, or
+  publishes as fast as the broker accepts with --speed max.
+- Fans each row out to several synthetic rover ids with --rovers N.
+- Reports the achieved message rate.
+- With --verify URL, checks that the server's /api/history ends up with exactly
+  the replayed rows (the server logs what it ingests, so this covers MQTT
+  ingest, log writing and history reads end to end).
+
+Usage:
+  python scripts/replay_log.py [--log data/odyssey_log.csv] [--speed 1|10|max]
+                               [--rovers 1] [--start ISO] [--end ISO] [--limit N]
+                               [--verify http://localhost:5000]
+
+Environment variables (optional, fallbacks shown):
+  MQTT_BROKER_HOSTNAME (default: the HiveMQ Cloud cluster)
+  MQTT_BROKER_PORT     (default: 8883)
+  MQTT_USERNAME / MQTT_PASSWORD
+  MQTT_TOPIC_TELEMETRY (default: 'rover/telemetry')
+  USE_TLS              (set to '1' to enable TLS; default: on for port 8883)
+"""
+
+import os
+import csv
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+import urllib.request
+from datetime import datetime, timezone
+
+import paho.mqtt.client as mqtt
+
+# Config (env overrides)
+BROKER = os.environ.get('MQTT_BROKER_HOSTNAME', '8bf0e6b18e164489b4b2da737bfee4ed.s1.eu.hivemq.cloud')
+PORT = int(os.environ.get('MQTT_BROKER_PORT', 8883))
+USERNAME = os.environ.get('MQTT_USERNAME', 'group2')
+PASSWORD = os.environ.get('MQTT_PASSWORD', 'Odyssey2')
+TOPIC_TELEMETRY = os.environ.get('MQTT_TOPIC_TELEMETRY', 'rover/telemetry')
+USE_TLS = os.environ.get('USE_TLS', '').lower() in ('1', 'true', 'yes') or PORT == 8883
+
+LOG_TIME_FORMAT = '%Y-%m-%d %H:%M:%S %Z'
+# /api/history returns at most this many rows per request (HISTORY_MAX_LIMIT in app.py)
+HISTORY_MAX_LIMIT = 20000
+# Float tolerance when comparing replayed values with what the server logged
+VALUE_TOLERANCE = 1e-6
+
+
+def parse_time(value):
+    value = value.strip()
+    try:
+        return datetime.strptime(value, LOG_TIME_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.timestamp()
+
+
+def to_number(value, cast=float):
+    try:
+        return cast(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def load_rows(path, start=None, end=None, limit=None):
+    """Read (ts, payload) pairs from a log file, optionally restricted to [start, end]."""
+    rows = []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for fields in csv.reader(f):
+            if not fields or fields[0] == 'timestamp' or len(fields) < 7:
+                continue
+            try:
+                ts = parse_time(fields[0])
+            except ValueError:
+                continue
+            if (start is not None and ts < start) or (end is not None and ts > end):
+                continue
+            rows.append((ts, {
+                'power': fields[1].strip().lower() in ('true', 'on', '1'),
+                'mode': fields[2].strip() or 'manual',
+                'forward_distance_cm': to_number(fields[3]),
+                'temperature_c': to_number(fields[4]),
+                'humidity_percent': to_number(fields[5]),
+                'air_quality_raw': to_number(fields[6], int),
+            }))
+            if limit and len(rows) >= limit:
+                break
+    return rows
+
+
+def is_logged(payload):
+    """Mirror of the server's logging filter: power on and every reading strictly positive."""
+    if not payload['power']:
+        return False
+    for key in ('forward_distance_cm', 'temperature_c', 'humidity_percent', 'air_quality_raw'):
+        if payload[key] is None or payload[key] <= 0:
+            return False
+    return True
+
+
+def connect_mqtt(inflight):
+    connected = threading.Event()
+    client = mqtt.Client(client_id=f'LogReplay-{os.getpid()}')
+    if USERNAME:
+        client.username_pw_set(USERNAME, PASSWORD)
+    if USE_TLS:
+        client.tls_set()
+    client.max_inflight_messages_set(inflight)
+    client.max_queued_messages_set(0)
+    client.on_connect = lambda c, userdata, flags, rc: connected.set() if rc == 0 else print(f'Connect refused (rc={rc})')
+    client.connect(BROKER, PORT, 60)
+    client.loop_start()
+    if not connected.wait(timeout=10):
+        raise RuntimeError(f'no CONNACK from {BROKER}:{PORT} within 10s')
+    return client
+
+
+def replay(client, rows, rover_ids, speed, max_gap, qos):
+    """Publish every row once per rover id; returns (messages, seconds until the last one was acknowledged)."""
+    infos = []
+    first_ts = rows[0][0]
+    prev_ts = first_ts
+    offset = 0.0           # schedule position in replay seconds
+    started = time.perf_counter()
+    for ts, payload in rows:
+        if speed:
+            # Absolute schedule so per-message overhead does not accumulate as drift;
+            # long pauses between recording sessions are capped at max_gap.
+            offset += min(max(ts - prev_ts, 0.0), max_gap) / speed
+            prev_ts = ts
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        for rover_id in rover_ids:
+            message = dict(payload, rover_id=rover_id)
+            infos.append(client.publish(TOPIC_TELEMETRY, json.dumps(message), qos=qos))
+    for info in infos:
+        info.wait_for_publish()
+    return len(infos), time.perf_counter() - started
+
+
+def http_json(url):
+    with urllib.request.urlopen(url, timeout=30) as res:
+        return json.loads(res.read().decode('utf-8'))
+
+
+def history_cursor(base_url):
+    return http_json(f'{base_url}/api/history?since=0&limit=1')['next_seq']
+
+
+def verify(base_url, before, expected, settle_s):
+    """Wait for the server to log `expected` rows after cursor `before`, then compare them in order."""
+    want = before + len(expected)
+    deadline = time.monotonic() + settle_s
+    cursor = history_cursor(base_url)
+    while cursor < want and time.monotonic() < deadline:
+        time.sleep(0.5)
+        cursor = history_cursor(base_url)
+    if cursor != want:
+        print(f'VERIFY FAIL: server logged {cursor - before} rows, expected {len(expected)}')
+        return False
+    # The history endpoint returns the newest rows after `since`, so check the
+    # tail when the replay is larger than one response.
+    check = expected[-HISTORY_MAX_LIMIT:]
+    series = http_json(f'{base_url}/api/history?since={want - len(check)}&limit={len(check)}')
+    got = list(zip(series['temperature_c'], series['humidity_percent'], series['air_quality_raw']))
+    if len(got) != len(check):
+        print(f'VERIFY FAIL: /api/history returned {len(got)} rows, expected {len(check)}')
+        return False
+    for i, (row, payload) in enumerate(zip(got, check)):
+        want_row = (payload['temperature_c'], payload['humidity_percent'], payload['air_quality_raw'])
+        if any(not math.isclose(a, b, rel_tol=0, abs_tol=VALUE_TOLERANCE) for a, b in zip(row, want_row)):
+            print(f'VERIFY FAIL: row {len(expected) - len(check) + i} differs: server {row} != log {want_row}')
+            return False
+    note = '' if len(check) == len(expected) else f' (last {len(check)} compared)'
+    print(f'VERIFY OK: {len(expected)} rows match{note}')
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded telemetry log over MQTT')
+    parser.add_argument('--log', default='data/odyssey_log.csv', help='log file or archived segment to replay')
+    parser.add_argument('--speed', default='1', help="time compression factor (1, 10, ...) or 'max' for no pacing")
+    parser.add_argument('--max-gap', type=float, default=5.0, help='cap on recorded pauses, in log seconds (default: 5)')
+    parser.add_argument('--rovers', type=int, default=1, help='number of synthetic rover ids to fan out to')
+    parser.add_argument('--rover-prefix', default='replay', help='synthetic rover id prefix (default: replay)')
+    parser.add_argument('--start', help='only replay rows at or after this time (ISO or log format)')
+    parser.add_argument('--end', help='only replay rows at or before this time')
+    parser.add_argument('--limit', type=int, help='replay at most this many rows')
+    parser.add_argument('--qos', type=int, choices=(0, 1), default=1, help='publish QoS (default: 1)')
+    parser.add_argument('--inflight', type=int, default=200, help='max unacknowledged QoS 1 messages')
+    parser.add_argument('--verify', metavar='URL', help='server base URL; check /api/history against the replayed rows')
+    parser.add_argument('--settle', type=float, default=30.0, help='seconds to wait for the server to catch up when verifying')
+    parser.add_argument('--host', help='MQTT broker hostname (overrides env)')
+    parser.add_argument('--port', type=int, help='MQTT broker port (overrides env)')
+    parser.add_argument('--tls', action='store_true', help='force TLS (overrides env)')
+    parser.add_argument('--topic', help='telemetry topic (overrides env)')
+    args = parser.parse_args()
+
+    global BROKER, PORT, TOPIC_TELEMETRY, USE_TLS
+    if args.host:
+        BROKER = args.host
+    if args.port:
+        PORT = args.port
+        USE_TLS = os.environ.get('USE_TLS', '').lower() in ('1', 'true', 'yes') or PORT == 8883
+    if args.topic:
+        TOPIC_TELEMETRY = args.topic
+    if args.tls:
+        USE_TLS = True
+
+    try:
+        speed = 0.0 if args.speed == 'max' else float(args.speed)
+    except ValueError:
+        parser.error('--speed must be a positive number or max')
+    if args.speed != 'max' and not speed > 0:
+        parser.error('--speed must be a positive number or max')
+    rows = load_rows(
+        args.log,
+        start=parse_time(args.start) if args.start else None,
+        end=parse_time(args.end) if args.end else None,
+        limit=args.limit,
+    )
+    if not rows:
+        print(f'No rows to replay in {args.log}')
+        sys.exit(1)
+    rover_ids = [f'{args.rover_prefix}-{i + 1:02d}' for i in range(max(args.rovers, 1))]
+    span = rows[-1][0] - rows[0][0]
+    print(f'Replaying {len(rows)} rows ({span:.0f}s of log) x {len(rover_ids)} rovers '
+          f'at {"max" if not speed else f"{speed:g}x"} speed -> {BROKER}:{PORT} {TOPIC_TELEMETRY}')
+
+    before = history_cursor(args.verify) if args.verify else None
+    try:
+        client = connect_mqtt(args.inflight)
+    except Exception as e:
+        print(f'Failed to connect to MQTT broker {BROKER}:{PORT} - {e}')
+        sys.exit(1)
+    try:
+        sent, elapsed = replay(client, rows, rover_ids, speed, args.max_gap, args.qos)
+    except KeyboardInterrupt:
+        print('Replay interrupted')
+        sys.exit(1)
+    finally:
+        client.loop_stop()
+        client.disconnect()
+    print(f'Published {sent} messages in {elapsed:.2f}s: {sent / elapsed if elapsed > 0 else math.inf:.1f} msg/s')
+
+    if args.verify:
+        # Each row is logged once per rover id, in publish order
+        expected = [payload for ts, payload in rows if is_logged(payload) for _ in rover_ids]
+        if not verify(args.verify.rstrip('/'), before, expected, args.settle):
+            sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
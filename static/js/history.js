@@ -1,62 +1,181 @@
-async function loadHistory() {
-  const res = await fetch("/api/history");
-  const data = await res.json();
-  const labels = data.labels || [];
-  const ctx1 = document.getElementById("tempChart");
-  new Chart(ctx1, {
-    type: "line",
-    data: {
-      labels,
-      datasets: [
-        {
-          label: "Temperature (°C)",
-          data: data.temperature_c || data.temperature || [],
-          borderColor: "#5b8cff",
-          tension: 0.3,
-        },
-      ],
+// Binary series layout produced by /api/history?format=bin (little-endian):
+// "ODYH" | u16 version | u16 columns | u32 count | u32 next_seq |
+// Float64[count] epoch-ms timestamps | Float32[count] per column.
+const SERIES_MAGIC = "ODYH";
+const SERIES_COLUMNS = ["temperature_c", "humidity_percent", "air_quality_raw"];
+const HISTORY_WINDOW = 2000;
+const POLL_INTERVAL_MS = 2000;
+
+function decodeSeries(buffer) {
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(
+    view.getUint8(0),
+    view.getUint8(1),
+    view.getUint8(2),
+    view.getUint8(3)
+  );
+  if (magic !== SERIES_MAGIC) throw new Error("bad series payload");
+  const columns = view.getUint16(6, true);
+  const count = view.getUint32(8, true);
+  // Typed-array views over the response buffer; no per-element parsing.
+  const series = {
+    count,
+    nextSeq: view.getUint32(12, true),
+    timestamps: new Float64Array(buffer, 16, count),
+  };
+  let offset = 16 + count * 8;
+  for (let c = 0; c < columns; c++) {
+    series[SERIES_COLUMNS[c]] = new Float32Array(buffer, offset, count);
+    offset += count * 4;
+  }
+  return series;
+}
+
+async function fetchSeries(since) {
+  const res = await fetch(
+    `/api/history?format=bin&since=${since}&limit=${HISTORY_WINDOW}`
+  );
+  if (!res.ok) throw new Error(`history request failed: ${res.status}`);
+  return decodeSeries(await res.arrayBuffer());
+}
+
+// Sliding window over preallocated typed arrays. Capacity is twice the window,
+// so appends only copy the new points; once the end is reached the live window
+// is compacted to the front (amortised O(1) per point).
+class SlidingSeries {
+  constructor(window) {
+    this.window = window;
+    this.capacity = window * 2;
+    this.timestamps = new Float64Array(this.capacity);
+    this.columns = {};
+    SERIES_COLUMNS.forEach((c) => (this.columns[c] = new Float32Array(this.capacity)));
+    this.start = 0;
+    this.end = 0;
+  }
+
+  get length() {
+    return this.end - this.start;
+  }
+
+  reset() {
+    this.start = 0;
+    this.end = 0;
+  }
+
+  append(batch) {
+    let from = 0;
+    let n = batch.count;
+    if (n > this.window) {
+      from = n - this.window;
+      n = this.window;
+    }
+    if (this.end + n > this.capacity) this.compact(n);
+    this.timestamps.set(batch.timestamps.subarray(from), this.end);
+    SERIES_COLUMNS.forEach((c) =>
+      this.columns[c].set(batch[c].subarray(from), this.end)
+    );
+    this.end += n;
+    if (this.length > this.window) this.start = this.end - this.window;
+  }
+
+  compact(incoming) {
+    const keep = Math.min(this.length, this.window - incoming);
+    const from = this.end - keep;
+    this.timestamps.copyWithin(0, from, this.end);
+    SERIES_COLUMNS.forEach((c) => this.columns[c].copyWithin(0, from, this.end));
+    this.start = 0;
+    this.end = keep;
+  }
+
+  view(column) {
+    return this.columns[column].subarray(this.start, this.end);
+  }
+
+  timestampAt(i) {
+    return this.timestamps[this.start + i];
+  }
+}
+
+function formatTimestamp(ms) {
+  if (!Number.isFinite(ms)) return "";
+  return new Date(ms).toISOString().replace("T", " ").slice(0, 19) + " UTC";
+}
+
+const series = new SlidingSeries(HISTORY_WINDOW);
+// Category labels are plain indices; timestamps are formatted only for the
+// ticks and tooltips that are actually drawn.
+const labels = [];
+const charts = [];
+let nextSeq = 0;
+
+function chartOptions() {
+  return {
+    responsive: true,
+    animation: false,
+    scales: {
+      x: { ticks: { callback: (value) => formatTimestamp(series.timestampAt(value)) } },
     },
-    options: {
-      responsive: true,
+    plugins: {
+      tooltip: {
+        callbacks: {
+          title: (items) => formatTimestamp(series.timestampAt(items[0].dataIndex)),
+        },
+      },
     },
-  });
+  };
+}
 
-  const ctx2 = document.getElementById("humChart");
-  new Chart(ctx2, {
+function makeChart(canvasId, label, column, color) {
+  const chart = new Chart(document.getElementById(canvasId), {
     type: "line",
     data: {
       labels,
-      datasets: [
-        {
-          label: "Humidity (%)",
-          data: data.humidity_percent || data.humidity || [],
-          borderColor: "#22d3ee",
-          tension: 0.3,
-        },
-      ],
-    },
-    options: {
-      responsive: true,
+      datasets: [{ label, data: series.view(column), borderColor: color, tension: 0.3 }],
     },
+    options: chartOptions(),
   });
+  chart.$column = column;
+  charts.push(chart);
+}
 
-  const ctx3 = document.getElementById("aqChart");
-  new Chart(ctx3, {
-    type: "line",
-    data: {
-      labels,
-      datasets: [
-        {
-          label: "Air Quality (Raw)",
-          data: data.air_quality_raw || data.air_quality || [],
-          borderColor: "#a78bfa",
-          tension: 0.3,
-        },
-      ],
-    },
-    options: {
-      responsive: true,
-    },
+function refreshCharts() {
+  while (labels.length < series.length) labels.push(labels.length);
+  labels.length = series.length;
+  charts.forEach((chart) => {
+    chart.data.labels = labels;
+    chart.data.datasets[0].data = series.view(chart.$column);
+    chart.update("none");
   });
 }
+
+async function pollHistory() {
+  try {
+    const batch = await fetchSeries(nextSeq);
+    if (batch.nextSeq < nextSeq) {
+      // Log was rotated or truncated on the server: start the window over.
+      series.reset();
+      nextSeq = 0;
+    } else {
+      if (batch.count) {
+        series.append(batch);
+        refreshCharts();
+      }
+      nextSeq = batch.nextSeq;
+    }
+  } catch (e) {
+    console.warn("History update failed:", e);
+  }
+  setTimeout(pollHistory, POLL_INTERVAL_MS);
+}
+
+async function loadHistory() {
+  const initial = await fetchSeries(0);
+  series.append(initial);
+  nextSeq = initial.nextSeq;
+  makeChart("tempChart", "Temperature (°C)", "temperature_c", "#5b8cff");
+  makeChart("humChart", "Humidity (%)", "humidity_percent", "#22d3ee");
+  makeChart("aqChart", "Air Quality (Raw)", "air_quality_raw", "#a78bfa");
+  refreshCharts();
+  setTimeout(pollHistory, POLL_INTERVAL_MS);
+}
 loadHistory();